@@ -13,6 +13,7 @@ if os.name == 'nt':
     # **健壮性修复**: 手动定义subprocess模块缺少的Windows常量
     CREATE_SUSPENDED = 0x00000400
 from .updater import check_and_update_songs # **版本更新**: 导入新模块 (使用相对导入修复ModuleNotFoundError)
+from .cover_prewarm import CoverPrewarmJob # **封面预热改造**
 
 # --- 配置 ---
 MAIN_APP_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
@@ -37,6 +38,13 @@ app_should_be_running = False  # 标记应用是否应该处于运行状态
 auto_restart_enabled = False   # 标记是否开启自动重启
 guardian_thread = None         # 守护线程的句柄
 
+# **封面预热改造**: 并发数与每秒请求数可在 .env 中调整；歌曲数据更新成功后可自动触发
+cover_prewarm_job = CoverPrewarmJob(
+    workers=int(os.getenv('COVER_PREWARM_WORKERS', '4')),
+    rate=float(os.getenv('COVER_PREWARM_RATE', '5')),
+)
+COVER_PREWARM_AFTER_UPDATE = os.getenv('COVER_PREWARM_AFTER_UPDATE', 'false').lower() in ('1', 'true', 'yes')
+
 # --- 辅助函数 ---
 def is_process_running(pid):
     """检查给定PID的进程是否仍在运行"""
@@ -304,6 +312,11 @@ def update_songs_data():
 
     # 调用更新逻辑
     result = check_and_update_songs()
+
+    # **封面预热改造**: 有新数据时顺带补齐新歌的封面
+    if COVER_PREWARM_AFTER_UPDATE and result['status'] == 'success':
+        if cover_prewarm_job.start(trigger="after_update"):
+            result['message'] += " 已开始在后台预热封面。"
     
     # 根据更新结果返回不同的状态码
     if result['status'] == 'error':
@@ -347,6 +360,26 @@ def delete_file():
     except Exception as e:
         return jsonify({"status": "error", "message": f"删除失败: {str(e)}"}), 500
 
+# --- **封面预热改造**: 启动/取消封面预热任务与查询进度 ---
+@app.route('/api/prewarm_covers', methods=['POST'])
+def start_cover_prewarm():
+    """启动后台封面预热任务 (已缓存的封面会被跳过，可反复执行)"""
+    if not cover_prewarm_job.start():
+        return jsonify({"status": "error", "message": "封面预热任务已在运行中。"}), 409
+    return jsonify({"status": "success", "message": "封面预热任务已启动。"})
+
+@app.route('/api/prewarm_covers/status', methods=['GET'])
+def get_cover_prewarm_status():
+    """返回封面预热任务的进度"""
+    return jsonify(cover_prewarm_job.get_progress())
+
+@app.route('/api/prewarm_covers/cancel', methods=['POST'])
+def cancel_cover_prewarm():
+    """取消正在运行的封面预热任务，已下载的封面保留"""
+    if not cover_prewarm_job.cancel():
+        return jsonify({"status": "error", "message": "当前没有正在运行的封面预热任务。"}), 400
+    return jsonify({"status": "success", "message": "已请求取消封面预热任务。"})
+
 # --- **反馈功能**: 新增获取反馈信息的API ---
 @app.route('/api/feedback', methods=['GET'])
 def get_feedback():
@@ -0,0 +1,152 @@
+import os
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from cover_fetcher import CoverFetcher, get_cover_len5_id
+
+# --- **封面预热改造**: 按歌曲库批量下载缺失的封面 ---
+# 新部署的节点在接流量之前跑一遍，之后所有封面都从本地磁盘读取。
+# 已存在的封面直接跳过，所以任务中断后重新启动即可从断点继续。
+
+ADMIN_DIR = os.path.dirname(__file__)
+MAIN_APP_ROOT = os.path.abspath(os.path.join(ADMIN_DIR, '..'))
+SONGS_JSON_PATH = os.path.join(MAIN_APP_ROOT, 'songs.json')
+COVER_CACHE_PATH = os.path.join(MAIN_APP_ROOT, 'covers')
+
+
+class RateLimiter:
+    """简单的全局限速: 所有工作线程共享，两次请求之间至少间隔 1/rate 秒"""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self._lock = threading.Lock()
+        self._next_at = time.monotonic()
+
+    def wait(self, stop_event):
+        if self.interval <= 0:
+            return
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_at)
+            self._next_at = slot + self.interval
+        # 用 stop_event.wait 代替 sleep，取消任务时不必等到限速结束
+        stop_event.wait(slot - now)
+
+
+def collect_cover_ids(songs_path=SONGS_JSON_PATH):
+    """songs.json 中所有歌曲对应的5位封面ID (去重，SD/DX 同曲共用的封面只下载一次)"""
+    with open(songs_path, 'r', encoding='utf-8') as f:
+        songs = json.load(f)
+    cover_ids = {}
+    for song in songs:
+        try:
+            cover_ids.setdefault(get_cover_len5_id(song['id']), song['id'])
+        except (KeyError, TypeError, ValueError):
+            continue
+    return list(cover_ids.values())
+
+
+class CoverPrewarmJob:
+    """
+    后台封面预热任务 (同一时间只运行一个):
+    - workers 个线程并发下载，整体请求速率不超过 rate 次/秒；
+    - 已缓存的封面不计入请求，直接记为 skipped；
+    - 进度通过 get_progress() 查询，可以随时 cancel()。
+    """
+
+    def __init__(self, cache_dir=COVER_CACHE_PATH, workers=4, rate=5.0):
+        self.cache_dir = cache_dir
+        self.workers = max(1, workers)
+        self.rate = rate
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._progress = {"status": "idle"}
+
+    def is_running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, trigger="manual"):
+        """启动任务。已在运行时返回 False"""
+        with self._lock:
+            if self.is_running():
+                return False
+            self._stop_event.clear()
+            self._progress = {
+                "status": "running", "trigger": trigger,
+                "total": 0, "done": 0, "downloaded": 0, "skipped": 0, "unavailable": 0,
+                "started_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"), "finished_at": None,
+                "elapsed_seconds": 0.0, "message": "正在读取歌曲列表...",
+            }
+            self._started_monotonic = time.monotonic()
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+            return True
+
+    def cancel(self):
+        """请求停止任务，已下载的封面保留，下次启动时跳过"""
+        if not self.is_running():
+            return False
+        self._stop_event.set()
+        return True
+
+    def get_progress(self):
+        with self._lock:
+            progress = dict(self._progress)
+            if progress["status"] == "running":
+                progress["elapsed_seconds"] = round(time.monotonic() - self._started_monotonic, 1)
+        return progress
+
+    def _update(self, **fields):
+        with self._lock:
+            self._progress.update(fields)
+
+    def _record(self, key):
+        with self._lock:
+            self._progress[key] += 1
+            self._progress["done"] += 1
+
+    def _run(self):
+        fetcher = None
+        try:
+            song_ids = collect_cover_ids()
+            fetcher = CoverFetcher(self.cache_dir, negative_ttl=0, error_ttl=0, pool_size=self.workers)
+            # 已缓存的封面先一次性跳过，只有缺失的才进入下载队列
+            missing = [song_id for song_id in song_ids if fetcher.cached_path(song_id) is None]
+            self._update(total=len(song_ids), done=len(song_ids) - len(missing),
+                         skipped=len(song_ids) - len(missing),
+                         message=f"共 {len(song_ids)} 个封面，需下载 {len(missing)} 个。")
+            print(f"封面预热: 共 {len(song_ids)} 个封面，{len(missing)} 个需要下载。")
+
+            limiter = RateLimiter(self.rate)
+
+            def fetch_one(song_id):
+                if self._stop_event.is_set():
+                    return
+                limiter.wait(self._stop_event)
+                if self._stop_event.is_set():
+                    return
+                self._record("downloaded" if fetcher.get(song_id) else "unavailable")
+
+            with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                list(executor.map(fetch_one, missing))
+
+            progress = self.get_progress()
+            status = "cancelled" if self._stop_event.is_set() else "finished"
+            message = (f"已下载 {progress['downloaded']} 个，跳过已缓存 {progress['skipped']} 个，"
+                       f"无法获取 {progress['unavailable']} 个。")
+            if status == "cancelled":
+                message = "任务已取消，" + message
+            self._update(status=status, message=message)
+            print(f"封面预热{'已取消' if status == 'cancelled' else '完成'}: {message}")
+        except Exception as e:
+            self._update(status="error", message=f"封面预热失败: {e}")
+            print(f"封面预热失败: {e}")
+        finally:
+            if fetcher is not None:
+                fetcher.session.close()
+            self._update(finished_at=datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                         elapsed_seconds=round(time.monotonic() - self._started_monotonic, 1))
@@ -14,6 +14,16 @@ ALIASES_JSON_PATH = os.path.join(MAIN_APP_ROOT, 'aliases.json') # **新增**: 
 MUSIC_DATA_URL = "https://www.diving-fish.com/api/maimaidxprober/music_data"
 ALIASES_DATA_URL = "https://www.yuzuchan.moe/api/maimaidx/maimaidxalias" # **新增**: 别名数据URL
 
+def _atomic_write_json(path, data, **dump_kwargs):
+    """
+    先写入同目录下的临时文件再整体替换，
+    主程序的歌曲库热加载因此不会读到写了一半的文件。
+    """
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, **dump_kwargs)
+    os.replace(tmp_path, path)
+
 def update_aliases():
     """
     下载并更新本地的 aliases.json 文件。
@@ -28,8 +38,7 @@ def update_aliases():
         if response.status_code == 200:
             # **健壮性修复**: 确保响应是JSON
             new_data = response.json()
-            with open(ALIASES_JSON_PATH, 'w', encoding='utf-8') as f:
-                json.dump(new_data, f, ensure_ascii=False, indent=2) # 使用indent增加可读性
+            _atomic_write_json(ALIASES_JSON_PATH, new_data, indent=2) # 使用indent增加可读性
             print("歌曲别名数据更新成功。")
             return {"status": "success", "message": "歌曲别名数据更新成功。"}
         else:
@@ -80,8 +89,7 @@ def check_and_update_songs():
         if response.status_code == 200:
             new_data = response.json()
             new_etag = response.headers.get('ETag')
-            with open(SONGS_JSON_PATH, 'w', encoding='utf-8') as f:
-                json.dump(new_data, f, ensure_ascii=False)
+            _atomic_write_json(SONGS_JSON_PATH, new_data)
             if new_etag:
                 with open(ETAG_FILE_PATH, 'w', encoding='utf-8') as f:
                     f.write(new_etag)
@@ -0,0 +1,58 @@
+from title_matcher import normalize_key
+
+
+class AliasIndex:
+    """
+    **别名倒排索引改造**: aliases.json 在加载时建立的双向索引。
+    规范化别名/官方标题 -> 歌曲标题列表，SongID -> 别名列表。
+    同一个别名被多首歌曲使用时记为冲突 (collisions)，查询时返回全部候选，而不是只取文件中的第一条。
+    """
+
+    def __init__(self, entries):
+        # 官方标题与别名分开索引: 查询恰好是某首歌的官方标题时，不应被其他歌曲的同名别名干扰
+        self.by_title_key = {}
+        self.by_alias_key = {}
+        self.by_song_id = {}
+        alias_count = 0
+        for entry in entries:
+            name = entry.get("Name")
+            if not name:
+                continue
+            self._add(self.by_title_key, normalize_key(name), name)
+            aliases = entry.get("Alias", []) or []
+            alias_count += len(aliases)
+            for alias in aliases:
+                self._add(self.by_alias_key, normalize_key(alias), name)
+            song_id = entry.get("SongID")
+            if song_id is not None:
+                self.by_song_id.setdefault(str(song_id), []).extend(aliases)
+        self.alias_count = alias_count
+        self.collisions = {key: names for key, names in self.by_alias_key.items()
+                           if len(names) > 1 and key not in self.by_title_key}
+        if self.collisions:
+            examples = ", ".join(f"'{key}' -> {names}" for key, names in list(self.collisions.items())[:3])
+            print(f"别名索引: {len(self.collisions)} 个别名对应多首歌曲，例如 {examples}")
+
+    @staticmethod
+    def _add(index, key, name):
+        if not key:
+            return
+        names = index.setdefault(key, [])
+        if name not in names:
+            names.append(name)
+
+    def lookup(self, query):
+        """返回查询词 (官方标题或别名) 对应的歌曲标题列表；多于一个即为别名冲突"""
+        key = normalize_key(query)
+        return list(self.by_title_key.get(key) or self.by_alias_key.get(key, []))
+
+    def aliases_for(self, song_id):
+        return list(self.by_song_id.get(str(song_id), []))
+
+    def get_stats(self):
+        return {
+            "alias_entries": len(self.by_song_id),
+            "alias_count": self.alias_count,
+            "alias_keys": len(self.by_alias_key),
+            "alias_collisions": len(self.collisions),
+        }
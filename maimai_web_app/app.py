@@ -2,17 +2,16 @@ import faulthandler
 faulthandler.enable()
 
 import os
+import io
 import json
-import shutil
 import time
 import traceback
-import math
 import uuid
 import requests
-import jwt # **终极改造**: 引入JWT解码库
 import threading
+import concurrent.futures
 from functools import wraps
-from flask import Flask, request, jsonify, render_template, send_from_directory, abort, g
+from flask import Flask, Request, Response, request, jsonify, render_template, send_file, send_from_directory, abort, g
 from cryptography.fernet import Fernet
 from dotenv import load_dotenv
 
@@ -21,12 +20,39 @@ load_dotenv()
 # --- **API封装改造**: 从环境变量中获取API密钥 ---
 API_KEY = os.getenv('API_KEY')
 
-from ultralytics import YOLO
-from paddleocr import PaddleOCR
-from fuzzywuzzy import process
+import cv2
+import numpy as np
+import recognizer
+import fast_json
+from inference_scheduler import YoloBatchScheduler
+from recognition_pool import RecognitionWorkerPool, RecognitionQueueFull, RecognitionTimeout
+from result_cache import RecognitionResultCache
+from pipeline import StagedPipeline, PipelineStage, PipelineFull
+from job_store import RecognitionJobStore, JobStoreFull
+from ingest import IngestedImage, ingest_image
+from song_catalog import SongCatalog
+from suggest_index import SUGGEST_DEFAULT_LIMIT, SUGGEST_MAX_LIMIT
+from cover_fetcher import CoverFetcher, get_cover_len5_id
+from cover_variants import CoverVariants
+from cover_sprites import CoverSpriteCache
+from user_store import UserStore
+
+# --- **零临时文件改造**: 上传文件始终保存在内存中 ---
+class InMemoryUploadRequest(Request):
+    """
+    Werkzeug默认会把超过500KB的上传文件缓存到临时文件中。
+    上传大小已由 MAX_CONTENT_LENGTH 限制，因此这里统一改为内存缓冲，避免任何磁盘IO。
+    """
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return io.BytesIO()
 
 # --- 1. 创建Flask应用和文件夹 ---
 app = Flask(__name__)
+app.request_class = InMemoryUploadRequest
+# 单张上传图片的大小上限 (MB)，可在 .env 中通过 MAX_UPLOAD_MB 配置
+app.config['MAX_UPLOAD_BYTES'] = int(os.getenv('MAX_UPLOAD_MB', '20')) * 1024 * 1024
+# 为multipart表单的边界与字段预留少量余量
+app.config['MAX_CONTENT_LENGTH'] = app.config['MAX_UPLOAD_BYTES'] + 64 * 1024
 app.config['UPLOAD_FOLDER'] = 'uploads'
 app.config['COVER_CACHE_FOLDER'] = 'covers'
 app.config['USER_DATA_FOLDER'] = 'user_data'
@@ -36,7 +62,8 @@ os.makedirs(app.config['COVER_CACHE_FOLDER'], exist_ok=True)
 os.makedirs(app.config['USER_DATA_FOLDER'], exist_ok=True)
 
 # --- **终极改造**: 加密与会话管理 ---
-server_sessions = {} # 内存会话字典，依然用于快速验证
+# **用户存储改造**: 会话保存在独立的 SQLite 文件中 (session_token 为主键)，不再依赖内存字典和用户JSON文件
+user_store = UserStore(os.getenv('USER_DB_PATH', os.path.join(app.config['USER_DATA_FOLDER'], 'users.db')))
 
 def load_or_generate_key():
     """加载或生成用于加密密码的密钥"""
@@ -66,90 +93,102 @@ feedback_lock = threading.Lock()
 
 # --- 2. 在应用启动时加载所有模型和数据 (只运行一次) ---
 
-# --- **别名搜索**: 加载别名数据 ---
-aliases_data = {}
-try:
-    aliases_json_path = os.path.join(app.root_path, 'aliases.json')
-    with open(aliases_json_path, 'r', encoding='utf-8') as f:
-        aliases_data = json.load(f)
-    print("别名数据加载成功！")
-except Exception as e:
-    print(f"警告: 加载别名数据失败: {e}")
+# --- **歌曲库常驻内存改造**: 歌曲与别名数据只解析一次，文件变化时自动热替换 ---
+song_catalog = SongCatalog(
+    songs_path=os.path.join(app.root_path, 'songs.json'),
+    aliases_path=os.path.join(app.root_path, 'aliases.json'),
+    etag_path=os.path.join(app.root_path, 'songs.etag'),
+    check_interval=float(os.getenv('SONG_CATALOG_CHECK_INTERVAL', '2')),
+)
 
 # --- **诊断**: 打印关键路径，以帮助调试文件保留问题 ---
-MONITORING_FLAG_PATH_DIAG = os.path.abspath(os.path.join(os.path.dirname(__file__), 'monitoring.flag'))
-print(f"--- [DIAGNOSTIC] Monitoring flag will be checked at this absolute path: {MONITORING_FLAG_PATH_DIAG} ---")
-
-print("正在加载YOLOv8模型...")
-# **终极路径修复**: 改为相对路径
-YOLO_MODEL_PATH = os.path.join(os.path.dirname(__file__), '..', 'ultralytics-main', 'runs', 'detect', 'train11', 'weights', 'best.pt')
-yolo_model = YOLO(YOLO_MODEL_PATH)
-print("YOLOv8模型加载成功！")
-
-print("正在加载PaddleOCR模型...")
-ocr_instance = PaddleOCR(
-    device="cpu",
-    enable_mkldnn=False,
-    cpu_threads=2,
-    use_doc_orientation_classify=False,
-    use_doc_unwarping=False,
-    use_textline_orientation=False,
-    text_recognition_model_name="PP-OCRv5_mobile_rec",
-    text_detection_model_name="PP-OCRv5_mobile_det", 
-)
-print("PaddleOCR模型加载成功！")
+print(f"--- [DIAGNOSTIC] Monitoring flag will be checked at this absolute path: {os.path.abspath(recognizer.MONITORING_FLAG_PATH)} ---")
+
+# --- **多进程改造**: 识别执行方式 ---
+# RECOGNITION_WORKERS > 0 时使用多进程工作池 (每个进程独立持有模型)；
+# 为 0 时在本进程中加载模型，并通过批处理调度器在线程间共享。
+RECOGNITION_WORKERS = int(os.getenv('RECOGNITION_WORKERS', '0'))
+RECOGNITION_JOB_TIMEOUT = float(os.getenv('RECOGNITION_JOB_TIMEOUT', '60'))
+recognition_pool = None
+yolo_scheduler = None
+
+if RECOGNITION_WORKERS > 0:
+    recognition_pool = RecognitionWorkerPool(
+        workers=RECOGNITION_WORKERS,
+        max_pending=int(os.getenv('RECOGNITION_QUEUE_SIZE', str(RECOGNITION_WORKERS * 4))),
+        job_timeout=RECOGNITION_JOB_TIMEOUT,
+        torch_threads=int(os.getenv('RECOGNITION_TORCH_THREADS', '1')),
+        preload=os.getenv('RECOGNITION_FORK_PRELOAD', '1') == '1',
+    )
+else:
+    yolo_model, ocr_instance = recognizer.load_models()
+    # --- **跨请求批处理改造**: 所有YOLO推理都经过批处理调度器 ---
+    yolo_scheduler = YoloBatchScheduler(
+        yolo_model,
+        max_batch_size=int(os.getenv('YOLO_BATCH_MAX_SIZE', '8')),
+        max_wait_ms=float(os.getenv('YOLO_BATCH_MAX_WAIT_MS', '10')),
+    )
+
+# --- **级联检测改造**: 各级检测命中率统计 (多进程模式下由主进程汇总) ---
+cascade_stats = recognizer.CascadeStats()
+
+# --- **识别缓存改造**: 按上传内容摘要缓存识别结果 (RESULT_CACHE_TTL=0 时关闭) ---
+result_cache = None
+if int(os.getenv('RESULT_CACHE_TTL', '600')) > 0:
+    result_cache = RecognitionResultCache(
+        ttl=int(os.getenv('RESULT_CACHE_TTL', '600')),
+        max_entries=int(os.getenv('RESULT_CACHE_MAX_ENTRIES', '2048')),
+        max_bytes=int(os.getenv('RESULT_CACHE_MAX_MB', '32')) * 1024 * 1024,
+    )
 
 # --- **终极改造**: 服务器启动时自动恢复会话 ---
 def restore_sessions_on_startup():
-    print("--- 正在从硬盘恢复用户会话 ---")
-    user_files = [f for f in os.listdir(app.config['USER_DATA_FOLDER']) if f.endswith('.json')]
-    restored_count = 0
-    for filename in user_files:
-        try:
-            user_data_path = os.path.join(app.config['USER_DATA_FOLDER'], filename)
-            with open(user_data_path, 'r', encoding='utf-8') as f:
-                user_data = json.load(f)
-            
-            username = user_data.get("username")
-            session_token = user_data.get("session_token")
-            jwt_token = user_data.get("jwt_token")
-
-            if not username or not session_token or not jwt_token:
-                print(f"警告: 文件 {filename} 缺少完整的会话信息，跳过。")
-                continue
-
-            # **终极会话持久化**: 直接从文件恢复会话到内存
-            server_sessions[session_token] = jwt_token
-            print(f"用户 [{username}] 的会话已从文件成功恢复。Session Token: {session_token[:8]}...")
-            restored_count += 1
+    """
+    **用户存储改造**: 会话已持久化在 SQLite 中，启动时无需恢复。
+    仅在第一次使用新存储时，从旧版用户JSON文件中一次性导入会话。
+    """
+    imported = user_store.import_sessions_from_files(app.config['USER_DATA_FOLDER'])
+    if imported is not None:
+        print(f"--- 已从旧版用户文件迁移 {imported} 个会话到 {user_store.db_path} ---")
 
-        except json.JSONDecodeError:
-            print(f"错误: 文件 {filename} 格式损坏，无法解析。")
-        except Exception as e:
-            print(f"恢复文件 {filename} 时出错: {e}")
-            traceback.print_exc()
-            
-    print(f"--- 会话恢复完成，共成功恢复 {restored_count} 个用户 ---")
+restore_sessions_on_startup()
 
 # ----------------------------------------------------
 
 # --- 辅助函数 ---
-def get_cover_len5_id(mid) -> str:
-    """将歌曲ID转换为符合水鱼API要求的5位数ID字符串"""
-    mid = int(mid)
-    if 10001 <= mid <= 11000:
-        mid -= 10000
-    return f"{mid:05d}"
-
-def find_best_match(ocr_text, songs_data):
-    """使用 fuzzywuzzy 查找最佳匹配的歌曲，并根据特定逻辑处理ID 184"""
+# **预序列化改造**: JSON 响应辅助函数
+def json_bytes_response(obj, status=200):
+    """用 fast_json (orjson) 编码较大的动态响应，比 jsonify 更快"""
+    return Response(fast_json.dumps(obj), status=status, mimetype='application/json')
+
+def cached_json_response(body, etag):
+    """返回预先编码好的响应体；客户端 If-None-Match 命中时直接返回 304"""
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        response = Response(body, mimetype='application/json')
+    response.set_etag(etag)
+    # 允许缓存但每次都要用 ETag 重新验证，歌曲库更新后立即生效
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+def find_best_match(ocr_text, catalog, include_aliases=False):
+    """
+    使用歌曲库的标题匹配引擎查找最佳匹配的歌曲，并根据特定逻辑处理ID 184。
+    include_aliases=True 时 (文本搜索) 通过 n-gram 索引同时在标题和别名中模糊查找。
+    """
     # 1. 预先找出歌曲184的标题
-    song_184_title = next((song['title'] for song in songs_data if song.get('id') == '00184'), None)
+    song_184 = catalog.by_id.get('00184')
+    song_184_title = song_184['title'] if song_184 else None
 
-    # 2. 获取所有唯一标题并进行模糊匹配，获取多个候选
-    unique_titles = list(set(song['title'] for song in songs_data))
+    # 2. **向量化匹配改造**: 一次C层批量打分，获取多个候选
     # **智能屏蔽改造**: 获取前2个匹配项以进行逻辑判断
-    matches = process.extract(ocr_text, unique_titles, limit=2)
+    matches = []
+    if include_aliases:
+        # **N-gram检索改造**: 先用 n-gram 索引取候选再精确打分，拼错的别名也能命中
+        matches = [(title, score) for title, score, _ in catalog.search_index.search(ocr_text, k=2)]
+    if not matches:
+        matches = catalog.title_matcher.top_k(ocr_text, k=2)
     
     # 3. 过滤出置信度高于60的匹配项
     confident_matches = [m for m in matches if m[1] > 60]
@@ -168,222 +207,133 @@ def find_best_match(ocr_text, songs_data):
         matched_title = second_best_match[0]
         print(f"智能屏蔽已触发：识别到'{song_184_title}'，但自动选择第二匹配项'{matched_title}'。")
     
-    # 5. 根据最终确定的标题查找所有版本
-    all_versions = [song for song in songs_data if song['title'] == matched_title]
-    
-    if all_versions:
-        for version in all_versions:
-            version['cover_url'] = f"/cover/{version['id']}"
-        return all_versions
-        
-    return None
-
-def find_song_by_alias(query, aliases_data, songs_data):
-    """通过别名查找歌曲"""
-    # 将查询转换为小写以进行不区分大小写的比较
-    lower_query = query.lower()
-    
-    # **修复**: 迭代 'content' 列表，而不是整个字典
-    for details in aliases_data.get('content', []):
-        # 检查官方标题
-        if lower_query == details.get("Name", "").lower():
-            matched_title = details["Name"]
-            break
-        # 检查别名列表
-        if any(lower_query == alias.lower() for alias in details.get("Alias", [])):
-            matched_title = details["Name"]
-            break
-    else: # 如果循环正常结束（没有break）
-        return None
+    # 5. 根据最终确定的标题查找所有版本 (cover_url 已在加载时写入)
+    all_versions = catalog.versions_of(matched_title)
+    return list(all_versions) if all_versions else None
 
-    # 如果找到了匹配的标题，就在songs_data中查找
-    all_versions = [song for song in songs_data if song['title'] == matched_title]
-    if all_versions:
-        for version in all_versions:
-            version['cover_url'] = f"/cover/{version['id']}"
-        return all_versions
-        
-    return None
+def find_song_by_alias(query, catalog):
+    """
+    通过别名 (或官方标题) 查找歌曲，返回歌曲库中存在的标题列表。
+    **别名倒排索引改造**: 查询走规范化后的倒排索引；列表多于一项说明该别名被多首歌曲使用。
+    """
+    return [title for title in catalog.alias_index.lookup(query) if catalog.versions_of(title)]
 
-def is_inside(inner_box, outer_box):
-    """检查 inner_box 是否在 outer_box 内部"""
-    ix1, iy1, ix2, iy2 = inner_box.xyxy[0]
-    ox1, oy1, ox2, oy2 = outer_box.xyxy[0]
-    return ix1 >= ox1 and iy1 >= oy1 and ix2 <= ox2 and iy2 <= oy2
+def alias_candidates(titles, catalog):
+    """别名冲突时的全部候选歌曲 (每个标题取第一个版本的ID与封面)"""
+    candidates = []
+    for title in titles:
+        first_version = catalog.versions_of(title)[0]
+        candidates.append({"id": first_version['id'], "title": title, "cover_url": first_version['cover_url']})
+    return candidates
 
-def get_most_centered_box(boxes, img_shape):
-    """从一组box中找到最居中的那一个"""
-    if not boxes:
-        return None
-    
-    img_height, img_width = img_shape
-    img_center_x, img_center_y = img_width / 2, img_height / 2
-    
-    min_distance = float('inf')
-    most_centered = None
-    
-    for box in boxes:
-        x1, y1, x2, y2 = box.xyxy[0]
-        box_center_x = (x1 + x2) / 2
-        box_center_y = (y1 + y2) / 2
-        distance = math.sqrt((box_center_x - img_center_x)**2 + (box_center_y - img_center_y)**2)
-        
-        if distance < min_distance:
-            min_distance = distance
-            most_centered = box
-            
-    return most_centered
+def alias_collision_response(query, titles, catalog):
+    """strict 模式下别名冲突时不做选择，返回 300 与全部候选，由调用方决定"""
+    return {"error": f"别名「{query}」对应多首歌曲，请输入更完整的歌名",
+            "candidates": alias_candidates(titles, catalog)}, 300
 
 # --- **API封装改造**: 核心识别逻辑函数 ---
-def recognize_song_from_image(filepath):
+def recognize_song_from_image(source):
     """
-    接收一个图片文件路径，执行完整的YOLO+OCR+匹配流程，并返回结果。
+    接收一个图片 (文件路径、BGR格式的ndarray 或 IngestedImage)，执行完整的YOLO+OCR+匹配流程，并返回结果。
     这个函数是整个识别功能的核心。
+    **识别缓存改造**: 内存图片先按内容摘要查询结果缓存，同一张图片重复上传或前端重试时直接返回。
     """
     unique_id = f"{int(time.time())}-{uuid.uuid4().hex[:6]}"
-    project_name = f"runs/detect/{unique_id}"
-    save_dir = None
-    
-    try:
-        # 1. 第一次YOLO预测
-        print(f"[{unique_id}] Running 1st YOLO prediction...")
-        yolo_results = yolo_model.predict(source=filepath, save_crop=True, project=project_name, name="predict_pass_1", device='cpu')
-        save_dir = yolo_results[0].save_dir
-        
-        if not yolo_results[0].boxes:
-            return {"error": "YOLO did not detect any objects in the first pass."}, 500
-        
-        boxes = yolo_results[0].boxes
-        img_shape = yolo_results[0].orig_shape
-        
-        all_boxes = {int(b.cls): [] for b in boxes}
-        for b in boxes:
-            all_boxes[int(b.cls)].append(b)
-
-        name_boxes = all_boxes.get(0, [])
-        name1_boxes = all_boxes.get(1, [])
-        frame1_boxes = all_boxes.get(2, [])
-        name2_boxes = all_boxes.get(3, [])
-        frame2_boxes = all_boxes.get(4, [])
-
-        # 2. 第一次筛选逻辑
-        target_box = None
-
-        if name_boxes:
-            target_box = get_most_centered_box(name_boxes, img_shape)
-        elif frame1_boxes:
-            name1_in_frame1 = [n1 for n1 in name1_boxes for f1 in frame1_boxes if is_inside(n1, f1)]
-            if name1_in_frame1:
-                target_box = get_most_centered_box(name1_in_frame1, img_shape)
-        elif frame2_boxes:
-            name2_in_frame2 = [n2 for n2 in name2_boxes for f2 in frame2_boxes if is_inside(n2, f2)]
-            if name2_in_frame2:
-                target_box = get_most_centered_box(name2_in_frame2, img_shape)
-        
-        # 3. **二次预测逻辑**
-        if not target_box and (frame1_boxes or frame2_boxes):
-            print(f"[{unique_id}] No direct name found. Initiating 2nd pass (Re-scan)...")
-            
-            frame_to_rescan_boxes = frame1_boxes if frame1_boxes else frame2_boxes
-            frame_label = "frame1" if frame1_boxes else "frame2"
-            most_centered_frame = get_most_centered_box(frame_to_rescan_boxes, img_shape)
-            
-            if most_centered_frame:
-                crop_dir_frame = os.path.join(save_dir, 'crops', frame_label)
-                if os.path.exists(crop_dir_frame) and os.listdir(crop_dir_frame):
-                    frame_crop_path = os.path.join(crop_dir_frame, os.listdir(crop_dir_frame)[0])
-                    print(f"[{unique_id}] Re-scanning crop: {frame_crop_path}")
-                    yolo_results_2 = yolo_model.predict(source=frame_crop_path, save_crop=True, project=project_name, name="predict_pass_2", device='cpu')
-                    
-                    if yolo_results_2[0].boxes:
-                        boxes_2 = yolo_results_2[0].boxes
-                        img_shape_2 = yolo_results_2[0].orig_shape
-                        all_boxes_2 = {int(b.cls): [] for b in boxes_2}
-                        for b in boxes_2:
-                            all_boxes_2[int(b.cls)].append(b)
-                        
-                        potential_targets_2 = all_boxes_2.get(0, []) + all_boxes_2.get(1, []) + all_boxes_2.get(3, [])
-                        
-                        if potential_targets_2:
-                            print(f"[{unique_id}] Success! Found name in 2nd pass.")
-                            target_box = get_most_centered_box(potential_targets_2, img_shape_2)
-                            save_dir = yolo_results_2[0].save_dir
-                        else:
-                             print(f"[{unique_id}] 2nd pass failed to find any name.")
-                else:
-                    print(f"[{unique_id}] Could not find crop for '{frame_label}' to re-scan.")
-
-        # 4. 如果二次预测后仍然没有目标，则执行最终降级策略
-        if not target_box:
-            print(f"[{unique_id}] 2nd pass failed or was not triggered. Applying final fallbacks.")
-            final_fallback_targets = name_boxes + name1_boxes + name2_boxes
-            if final_fallback_targets:
-                target_box = get_most_centered_box(final_fallback_targets, img_shape)
-
-        # 5. 如果最终还是没有找到，则报错
-        if not target_box:
-            return {"error": "未能识别到歌曲名，请尝试调整拍摄角度，确保画面清晰、无反光。"}, 500
-        # 6. 处理最终的目标裁剪图
-        target_label = yolo_model.names[int(target_box.cls)]
-        print(f"[{unique_id}] Final target selected: a '{target_label}' box.")
-        crop_dir = os.path.join(save_dir, 'crops', target_label)
-        
-        if not os.path.exists(crop_dir) or not os.listdir(crop_dir):
-            return {"error": f"YOLO did not generate any crops for the final target '{target_label}'."}, 500
-        
-        crop_image_name = os.listdir(crop_dir)[0]
-        crop_image_path = os.path.join(crop_dir, crop_image_name)
-
-        # 7. OCR识别
-        print(f"[{unique_id}] Processing final crop: {crop_image_path}")
-        ocr_text = ""
-        try:
-            ocr_result = ocr_instance.predict(crop_image_path)
-            if ocr_result and ocr_result[0] is not None:
-                texts = ocr_result[0].get('rec_texts', [])
-                filtered_texts = [text for text in texts if '等级' not in text]
-                ocr_text = "".join(filtered_texts)
-                print(f"[{unique_id}] OCR Result: {ocr_text}")
-        except BaseException:
-            print(f"--- [{unique_id}] OCR FAILED WITH UNKNOWN EXCEPTION ---")
-            traceback.print_exc()
-            ocr_text = ""
-
-        if not ocr_text:
-            return {"error": "OCR did not recognize any text from the best crop."}, 404
-
-        # 8. 匹配并返回结果
-        songs_json_path = os.path.join(app.root_path, 'songs.json')
-        with open(songs_json_path, 'r', encoding='utf-8') as f:
-            songs_data = json.load(f)
-        
-        best_match_song = find_best_match(ocr_text, songs_data)
-
-        if best_match_song:
-            return best_match_song, 200
-        else:
-            return {"error": "未能识别到歌曲名，请尝试调整拍摄角度，确保画面清晰、无反光。"}, 404
 
+    image_digest = None
+    if result_cache is not None and isinstance(source, (np.ndarray, IngestedImage)):
+        image_digest = (source if isinstance(source, IngestedImage) else IngestedImage.from_array(source)).digest
+        cached = result_cache.get(image_digest)
+        if cached is not None:
+            print(f"[{unique_id}] Result cache hit (sha256={image_digest[:16]}).")
+            return cached
+
+    result, status_code = _run_recognition(source, unique_id)
+    # 只缓存成功匹配的结果: 识别失败 (404) 时前端会重试，缓存失败结果会让重试在TTL内一直失败
+    if image_digest is not None and status_code == 200:
+        result_cache.put(image_digest, result, status_code)
+    return result, status_code
+
+def match_ocr_text(ocr_text):
+    """用OCR文本匹配歌曲，返回 (结果, 状态码)"""
+    best_match_song = find_best_match(ocr_text, song_catalog.get())
+
+    if best_match_song:
+        return best_match_song, 200
+    else:
+        return {"error": recognizer.NO_TITLE_ERROR}, 404
+
+def stage_match(ctx):
+    """流水线的最后一个阶段: 歌曲匹配"""
+    ctx["match"] = match_ocr_text(ctx["ocr_text"])
+
+# --- **流水线改造**: 本进程识别时，解码/检测/选框/OCR/匹配 各阶段使用独立线程池 ---
+recognition_pipeline = None
+if recognition_pool is None and os.getenv('RECOGNITION_PIPELINE', '1') == '1':
+    PIPELINE_QUEUE_SIZE = int(os.getenv('PIPELINE_QUEUE_SIZE', '16'))
+    recognition_pipeline = StagedPipeline([
+        PipelineStage('decode', recognizer.stage_decode,
+                      workers=int(os.getenv('PIPELINE_DECODE_WORKERS', '2')), queue_size=PIPELINE_QUEUE_SIZE),
+        # 检测线程数决定了能同时送进批处理调度器的请求数
+        PipelineStage('detect', lambda ctx: recognizer.stage_detect(ctx, yolo_scheduler.predict),
+                      workers=int(os.getenv('PIPELINE_DETECT_WORKERS', '4')), queue_size=PIPELINE_QUEUE_SIZE),
+        PipelineStage('select', recognizer.stage_select,
+                      workers=int(os.getenv('PIPELINE_SELECT_WORKERS', '1')), queue_size=PIPELINE_QUEUE_SIZE),
+        PipelineStage('ocr', recognizer.stage_ocr,
+                      workers=int(os.getenv('PIPELINE_OCR_WORKERS', '1')), queue_size=PIPELINE_QUEUE_SIZE),
+        PipelineStage('match', stage_match,
+                      workers=int(os.getenv('PIPELINE_MATCH_WORKERS', '1')), queue_size=PIPELINE_QUEUE_SIZE),
+    ])
+
+def _run_recognition(source, unique_id):
+    """
+    **多进程改造**: YOLO+OCR 部分交给工作进程池、分阶段流水线或本线程执行，这里只负责提交、等待与匹配。
+    队列已满时抛出 RecognitionQueueFull，由错误处理器返回 503。
+    """
+    try:
+        if recognition_pool is not None:
+            ocr_text, error, cascade = recognition_pool.run(source, unique_id)
+            cascade_stats.record(cascade)
+            if error:
+                return error
+            return match_ocr_text(ocr_text)
+
+        if recognition_pipeline is not None:
+            try:
+                future = recognition_pipeline.submit(recognizer.new_context(source, unique_id))
+            except PipelineFull:
+                raise RecognitionQueueFull(retry_after=1)
+            try:
+                ctx = future.result(timeout=RECOGNITION_JOB_TIMEOUT)
+            except concurrent.futures.TimeoutError:
+                raise RecognitionTimeout(f"识别任务 {unique_id} 超过 {RECOGNITION_JOB_TIMEOUT} 秒未完成")
+            recognizer.finish_context(ctx)
+            cascade_stats.record(ctx["cascade"])
+            return ctx["error"] or ctx["match"]
+
+        ocr_text, error, cascade = recognizer.detect_and_read_title(source, unique_id, predict=yolo_scheduler.predict)
+        cascade_stats.record(cascade)
+        if error:
+            return error
+        return match_ocr_text(ocr_text)
+
+    except RecognitionQueueFull:
+        raise
+    except RecognitionTimeout as e:
+        print(f"--- [{unique_id}] {e} ---")
+        return {'error': '识别超时，请稍后重试'}, 504
     except BaseException as e:
         error_message = f"An unexpected error occurred: {str(e)}"
         print(f"--- [{unique_id}] FATAL ERROR ---")
         traceback.print_exc()
         return {'error': 'An unexpected error occurred', 'details': error_message}, 500
-    finally:
-        # **监控模式改造与健壮性修复**
-        monitoring_flag_path = os.path.join(app.root_path, 'monitoring.flag')
-        flag_exists = os.path.exists(monitoring_flag_path)
-        
-        if not flag_exists:
-            print(f"[{unique_id}] Cleaning up temporary files...")
-            if save_dir and os.path.exists(save_dir):
-                try:
-                    shutil.rmtree(save_dir)
-                except Exception as e:
-                    print(f"[{unique_id}] Error deleting prediction folder: {e}")
-            # Note: The original uploaded file is cleaned up by the caller
-        else:
-            print(f"[{unique_id}] Monitoring mode is ON. Temporary files are preserved.")
+
+@app.errorhandler(RecognitionQueueFull)
+def recognition_queue_full(e):
+    response = jsonify({'error': '服务器繁忙，识别队列已满，请稍后重试'})
+    response.status_code = 503
+    response.headers['Retry-After'] = str(e.retry_after)
+    return response
 
 # --- **API封装改造**: API密钥认证装饰器 ---
 def api_key_required(f):
@@ -399,6 +349,26 @@ def api_key_required(f):
         return f(*args, **kwargs)
     return decorated_function
 # --- 主路由 ---
+# --- **跨请求批处理改造**: 运行指标接口 ---
+@app.route('/api/metrics', methods=['GET'])
+@api_key_required
+def get_metrics():
+    """返回推理调度等内部组件的运行统计，便于调优各项参数"""
+    return jsonify({
+        "yolo_batching": yolo_scheduler.get_stats() if yolo_scheduler else None,
+        "recognition_pool": recognition_pool.get_stats() if recognition_pool else None,
+        "result_cache": result_cache.get_stats() if result_cache else None,
+        "detector_backend": recognizer.active_detector_backend or recognizer.DETECTOR_BACKEND,
+        "detector_cascade": cascade_stats.get_stats(),
+        "song_catalog": song_catalog.get_stats(),
+        "cover_fetcher": cover_fetcher.get_stats(),
+        "cover_variants": cover_variants.get_stats(),
+        "cover_sprites": cover_sprites.get_stats(),
+        "user_store": user_store.get_stats(),
+        "pipeline": recognition_pipeline.get_stats() if recognition_pipeline else None,
+        "recognition_jobs": recognition_jobs.get_stats(),
+    })
+
 @app.route('/favicon.ico')
 def favicon():
     return send_from_directory(os.path.join(app.root_path, 'image', 'ico'),
@@ -425,30 +395,43 @@ def serve_image(subfolder, filename):
     return send_from_directory(image_dir, filename)
 
 # --- **新增**: 封面获取与缓存路由 ---
+# --- **封面下载改造**: 连接池复用、并发去重、原子写入与负缓存 (见 cover_fetcher.py) ---
+cover_fetcher = CoverFetcher(
+    app.config['COVER_CACHE_FOLDER'],
+    connect_timeout=float(os.getenv('COVER_CONNECT_TIMEOUT', '3')),
+    read_timeout=float(os.getenv('COVER_READ_TIMEOUT', '10')),
+    negative_ttl=int(os.getenv('COVER_NEGATIVE_TTL', '3600')),
+)
+
+# --- **封面缩略图改造**: ?w= 返回按宽度缩小的 WebP/AVIF 变体 (见 cover_variants.py) ---
+cover_variants = CoverVariants(
+    app.config['COVER_CACHE_FOLDER'],
+    widths=[int(w) for w in os.getenv('COVER_VARIANT_WIDTHS', '96,200').split(',') if w.strip()],
+)
+# 封面内容不会变化，且 ETag 即内容哈希，允许浏览器与CDN长期缓存
+COVER_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+def send_cover_file(path, mimetype, etag):
+    response = send_file(os.path.abspath(path), mimetype=mimetype, etag=etag, conditional=True)
+    response.headers['Cache-Control'] = COVER_CACHE_CONTROL
+    return response
+
 @app.route('/cover/<song_id>')
 def get_song_cover(song_id):
     try:
-        cover_id_str = get_cover_len5_id(song_id)
-        cover_filename = f"{cover_id_str}.png"
-        cached_cover_path = os.path.join(app.config['COVER_CACHE_FOLDER'], cover_filename)
-
-        # 1. 检查本地缓存
-        if os.path.exists(cached_cover_path):
-            return send_from_directory(app.config['COVER_CACHE_FOLDER'], cover_filename)
-
-        # 2. 如果没有缓存，则从外部API下载
-        external_url = f"https://www.diving-fish.com/covers/{cover_id_str}.png"
-        response = requests.get(external_url, stream=True)
-
-        # 3. 检查下载是否成功
-        if response.status_code == 200:
-            # 保存到缓存
-            with open(cached_cover_path, 'wb') as f:
-                response.raw.decode_content = True
-                shutil.copyfileobj(response.raw, f)
-            
-            # 发送给客户端
-            return send_from_directory(app.config['COVER_CACHE_FOLDER'], cover_filename)
+        # 1. 检查本地缓存，没有缓存时从外部API下载 (同一封面的并发请求共享一次下载)
+        cached_cover_path = cover_fetcher.get(song_id)
+        if cached_cover_path:
+            width = request.args.get('w', type=int)
+            if width and width > 0:
+                # 2. 缩略图: 按 Accept 头选择格式，响应因此需要 Vary: Accept
+                accepted = {mimetype for mimetype, quality in request.accept_mimetypes if quality > 0}
+                variant_path, mimetype, etag = cover_variants.get(
+                    cached_cover_path, width, cover_variants.negotiate(accepted))
+                response = send_cover_file(variant_path, mimetype, etag)
+                response.vary.add('Accept')
+                return response
+            return send_cover_file(cached_cover_path, 'image/png', cover_variants.etag_for(cached_cover_path))
         else:
             # **终极健壮性修复**: 如果下载失败，直接返回后备图片
             print(f"Cover for song_id {song_id} not found. Serving fallback image.")
@@ -460,15 +443,55 @@ def get_song_cover(song_id):
         return send_from_directory(os.path.join(app.root_path, 'image', '404'), '404.png')
 
 
-# --- **终极改造**: 新增JWT解码辅助函数 ---
-def get_username_from_jwt(jwt_token):
-    """从Diving-Fish的JWT中解码出用户名，不验证签名"""
+# --- **封面雪碧图改造**: 一组封面拼成一张图，B50 页面只需一次图片请求 (见 cover_sprites.py) ---
+cover_sprites = CoverSpriteCache(
+    cover_fetcher,
+    os.path.join(app.config['COVER_CACHE_FOLDER'], 'sprites'),
+    os.path.join(app.root_path, 'image', '404', '404.png'),
+    # 图片地址的签名密钥由本地密钥文件派生 (不直接使用加密密码的密钥)，重启后已发出的地址仍然有效
+    secret=encryption_key,
+    max_entries=int(os.getenv('COVER_SPRITE_CACHE_ENTRIES', '256')),
+    # 缺少封面的雪碧图与封面下载失败的负缓存保留同样长的时间
+    incomplete_ttl=cover_fetcher.error_ttl,
+)
+# B50 页面的格子宽度，与单张缩略图使用同一组档位
+B50_SPRITE_TILE = 200
+
+def parse_sprite_args():
+    """解析 ?ids=1,2,3&w=200，返回 (ID列表, 格子宽度)"""
+    ids = [song_id for song_id in request.args.get('ids', '').split(',') if song_id.strip()]
+    width = request.args.get('w', type=int) or B50_SPRITE_TILE
+    return ids, cover_variants.snap_width(width)
+
+@app.route('/api/covers/sprite', methods=['GET'])
+def get_cover_sprite():
+    """返回拼接好的封面雪碧图 (WebP，不支持时为PNG)；只接受 /api/b50 或 /api/covers/sprite/map 给出的带签名地址"""
     try:
-        decoded = jwt.decode(jwt_token, options={"verify_signature": False})
-        return decoded.get("username")
-    except Exception as e:
-        print(f"JWT解码失败: {e}")
-        return None
+        ids, tile = parse_sprite_args()
+        accepted = {mimetype for mimetype, quality in request.accept_mimetypes if quality > 0}
+        data, mimetype, etag, complete = cover_sprites.get(
+            ids, tile, cover_sprites.negotiate(accepted), request.args.get('sig'))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except PermissionError as e:
+        return jsonify({"error": str(e)}), 403
+    response = Response(data, mimetype=mimetype)
+    response.set_etag(etag)
+    response.vary.add('Accept')
+    # 缺少封面的雪碧图使用了占位图，不能长期缓存
+    response.headers['Cache-Control'] = COVER_CACHE_CONTROL if complete else 'no-cache'
+    return response.make_conditional(request)
+
+@app.route('/api/covers/sprite/map', methods=['GET'])
+@api_key_required
+def get_cover_sprite_map():
+    """返回雪碧图地址与每首歌在图中的偏移 {url, tile, columns, rows, width, height, offsets}"""
+    try:
+        ids, tile = parse_sprite_args()
+        return jsonify(cover_sprites.describe(ids, tile))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
 
 def _get_latest_data_from_fish(jwt_token):
     """
@@ -496,6 +519,28 @@ def _get_latest_data_from_fish(jwt_token):
     
     return merged_data
 
+# --- **用户存储改造**: 用户文件路径与旧数据的按需迁移 ---
+def get_user_data_path(username):
+    safe_filename = "".join(c for c in username if c.isalnum() or c in ('_', '-')).rstrip()
+    return os.path.join(app.config['USER_DATA_FOLDER'], f"{safe_filename}.json")
+
+def load_user_profile(username):
+    """
+    从 user_store 读取个人资料；数据库中还没有该用户时 (升级前登录的用户)，
+    从旧版用户文件导入一次资料与成绩。两处都没有数据时返回 None。
+    """
+    profile = user_store.get_profile(username)
+    if profile is not None:
+        return profile
+    user_data_path = get_user_data_path(username)
+    if not os.path.exists(user_data_path):
+        return None
+    with open(user_data_path, 'r', encoding='utf-8') as f:
+        user_data = json.load(f)
+    count = user_store.save_user_data(username, user_data)
+    print(f"用户 [{username}] 的 {count} 条成绩已从本地文件导入数据库。")
+    return user_store.get_profile(username)
+
 # --- **新增**: 认证装饰器 ---
 def token_required(f):
     @wraps(f)
@@ -507,24 +552,14 @@ def token_required(f):
         if not token:
             return jsonify({'message': 'Token is missing!'}), 401
 
-        if token not in server_sessions:
+        # **用户存储改造**: 一次主键查询同时得到用户名与JWT
+        session = user_store.get_session(token)
+        if not session:
             return jsonify({'message': 'Token is invalid or expired!'}), 401
         
         # **留言板改造**: 将用户名存入g，方便后续路由使用
-        jwt_token = server_sessions.get(token)
-        username = get_username_from_jwt(jwt_token)
-        if not username:
-            # 如果JWT解析失败，尝试从本地文件后备
-            user_files = [f for f in os.listdir(app.config['USER_DATA_FOLDER']) if f.endswith('.json')]
-            for filename in user_files:
-                user_data_path = os.path.join(app.config['USER_DATA_FOLDER'], filename)
-                with open(user_data_path, 'r', encoding='utf-8') as f_user:
-                    user_data = json.load(f_user)
-                if user_data.get("session_token") == token:
-                    username = user_data.get("username")
-                    break
-        
-        g.username = username
+        g.username = session["username"]
+        g.jwt_token = session["jwt_token"]
         return f(*args, **kwargs)
     return decorated
 
@@ -562,18 +597,17 @@ def login():
 
         # 3. 创建并添加新的认证信息
         session_token = str(uuid.uuid4())
-        user_data["session_token"] = session_token
-        user_data["jwt_token"] = df_jwt
         user_data["encrypted_password"] = encrypt_password(password)
 
-        # 4. 将完整的用户数据写入文件
-        safe_filename = "".join(c for c in actual_username if c.isalnum() or c in ('_', '-')).rstrip()
-        user_data_path = os.path.join(app.config['USER_DATA_FOLDER'], f"{safe_filename}.json")
+        # 4. 将完整的用户数据写入数据库与文件
+        # **用户存储改造**: 资料与成绩同时写入数据库，查询时不再读取整个文件
+        user_store.save_user_data(actual_username, user_data)
+        user_data_path = get_user_data_path(actual_username)
         with open(user_data_path, 'w', encoding='utf-8') as f:
             json.dump(user_data, f, ensure_ascii=False, indent=4)
         
-        # 5. 更新内存会话并返回
-        server_sessions[session_token] = df_jwt
+        # 5. 保存会话并返回
+        user_store.save_session(session_token, actual_username, df_jwt)
         print(f"用户 [{actual_username}] 的完整数据和会话已创建并保存。")
         return jsonify({"message": "登录成功", "session_token": session_token})
 
@@ -590,8 +624,7 @@ def login():
 def logout():
     """处理用户登出"""
     token = request.headers['x-access-token']
-    if token in server_sessions:
-        del server_sessions[token]
+    user_store.delete_session(token)
     return jsonify({"message": "登出成功"})
 
 @app.route('/api/profile/refresh', methods=['POST'])
@@ -601,7 +634,7 @@ def refresh_profile():
     **终极架构重建**: 刷新端点现在负责完整的用户数据更新流程。
     """
     session_token = request.headers['x-access-token']
-    jwt_token = server_sessions.get(session_token)
+    jwt_token = g.jwt_token
     
     try:
         # 1. 获取最新的完整用户数据
@@ -610,27 +643,21 @@ def refresh_profile():
         if not username:
             return jsonify({"error": "刷新时未能获取用户名"}), 500
 
-        # 2. 从旧文件中继承认证信息
-        safe_filename = "".join(c for c in username if c.isalnum() or c in ('_', '-')).rstrip()
-        user_data_path = os.path.join(app.config['USER_DATA_FOLDER'], f"{safe_filename}.json")
+        # 2. 从旧文件中继承加密后的密码 (会话信息由 user_store 保存，不再写入用户文件)
+        user_data_path = get_user_data_path(username)
         
         if os.path.exists(user_data_path):
             with open(user_data_path, 'r', encoding='utf-8') as f:
                 old_data = json.load(f)
-            new_data["session_token"] = old_data.get("session_token", session_token) # 保持旧token不变
             new_data["encrypted_password"] = old_data.get("encrypted_password")
-        else:
-            # 这是一个异常情况，但为了健壮性，我们还是处理一下
-            new_data["session_token"] = session_token
-        
-        new_data["jwt_token"] = jwt_token
 
-        # 3. 将更新后的完整数据写回文件
+        # 3. 将更新后的完整数据写入数据库并写回文件 (顺序同登录)
+        user_store.save_user_data(username, new_data)
         with open(user_data_path, 'w', encoding='utf-8') as f:
             json.dump(new_data, f, ensure_ascii=False, indent=4)
 
-        # 4. 更新内存会话并返回
-        server_sessions[new_data["session_token"]] = jwt_token
+        # 4. 更新会话并返回
+        user_store.save_session(session_token, username, jwt_token)
         print(f"用户 [{username}] 的数据已刷新并保存。")
         return jsonify({
             "rating": new_data.get("rating"),
@@ -650,35 +677,16 @@ def refresh_profile():
 @token_required
 def get_profile():
     """
-    **终极数据一致性修复**: 直接从本地缓存文件读取并返回个人资料。
-    本地文件是唯一的数据源，通过 /api/profile/refresh 更新。
+    **终极数据一致性修复**: 直接从本地存储读取并返回个人资料，通过 /api/profile/refresh 更新。
+    **用户存储改造**: 只查询数据库中的资料列，不再加载包含全部成绩的用户文件。
     """
     try:
-        session_token = request.headers['x-access-token']
-        jwt_token = server_sessions.get(session_token)
-        username = get_username_from_jwt(jwt_token)
-
-        if not username:
-            return jsonify({"error": "无法从Token中解析用户名"}), 401
-
-        safe_filename = "".join(c for c in username if c.isalnum() or c in ('_', '-')).rstrip()
-        user_data_path = os.path.join(app.config['USER_DATA_FOLDER'], f"{safe_filename}.json")
-
-        if not os.path.exists(user_data_path):
+        profile = load_user_profile(g.username)
+        if profile is None:
             return jsonify({"error": "未找到该用户的本地数据文件，请尝试重新登录或更新数据。"}), 404
 
-        with open(user_data_path, 'r', encoding='utf-8') as f:
-            local_data = json.load(f)
-        
         # 返回前端需要的所有字段
-        profile_to_return = {
-            "rating": local_data.get("rating"),
-            "username": local_data.get("username"),
-            "bind_qq": local_data.get("bind_qq"),
-            "additional_rating": local_data.get("additional_rating"),
-            "plate": local_data.get("plate")
-        }
-        return jsonify(profile_to_return)
+        return jsonify(profile)
 
     except Exception as e:
         print(f"获取本地个人资料时出错: {e}")
@@ -694,24 +702,8 @@ def get_b50():
     并用本地歌曲信息进行丰富后返回。
     """
     try:
-        # 1. 获取认证信息和用户名
-        session_token = request.headers['x-access-token']
-        jwt_token = server_sessions.get(session_token)
-        username = get_username_from_jwt(jwt_token)
-
-        if not username:
-            # **终极健壮性修复**: 如果JWT解析失败，尝试从本地文件获取用户名作为后备
-            user_files = [f for f in os.listdir(app.config['USER_DATA_FOLDER']) if f.endswith('.json')]
-            for filename in user_files:
-                user_data_path = os.path.join(app.config['USER_DATA_FOLDER'], filename)
-                with open(user_data_path, 'r', encoding='utf-8') as f:
-                    user_data = json.load(f)
-                if user_data.get("session_token") == session_token:
-                    username = user_data.get("username")
-                    break
-        
-        if not username:
-            return jsonify({"error": "无法确定用户名，请尝试重新登录。"}), 401
+        # 1. 用户名来自会话存储 (token_required 已写入 g)
+        username = g.username
 
         # 2. 从Diving-Fish获取B50数据
         print(f"正在为用户 [{username}] 查询B50数据...")
@@ -735,11 +727,8 @@ def get_b50():
         b15_records = dx_records[:15] # 新版 Best 15
         b35_records = sd_records[:35] # 旧版 Best 35
 
-        # 4. 加载本地歌曲数据库以丰富信息
-        songs_json_path = os.path.join(app.root_path, 'songs.json')
-        with open(songs_json_path, 'r', encoding='utf-8') as f:
-            songs_data = json.load(f)
-        songs_map = {str(song['id']): song for song in songs_data}
+        # 4. 使用常驻内存的歌曲库 (id 索引) 丰富信息
+        songs_map = song_catalog.get().by_id
 
         # 5. 封装一个函数来丰富列表，避免代码重复
         def enrich_records(records):
@@ -761,10 +750,20 @@ def get_b50():
         enriched_b15 = enrich_records(b15_records)
         enriched_b35 = enrich_records(b35_records)
 
-        # 6. 以结构化对象返回 (根据用户最新指示修正)
-        return jsonify({
+        # 6. **封面雪碧图改造**: 附带全部封面的雪碧图地址与偏移表，前端只需请求一张图片
+        sprite = None
+        sprite_ids = [record.get("song_id") for record in enriched_b15 + enriched_b35 if record.get('cover_url')]
+        if sprite_ids:
+            try:
+                sprite = cover_sprites.describe(sprite_ids, B50_SPRITE_TILE)
+            except ValueError as e:
+                print(f"生成B50雪碧图描述失败: {e}")
+
+        # 7. 以结构化对象返回 (根据用户最新指示修正)
+        return json_bytes_response({
             "b15": enriched_b15,
-            "b35": enriched_b35
+            "b35": enriched_b35,
+            "sprite": sprite
         })
 
     except requests.exceptions.HTTPError as e:
@@ -787,7 +786,7 @@ def get_b50():
 @app.route('/api/player_score', methods=['POST'])
 @token_required
 def get_player_score():
-    """根据歌曲ID，从本地用户文件中查找并返回玩家的成绩，并附带谱面总分"""
+    """根据歌曲ID，从本地成绩库中查找并返回玩家的成绩，并附带谱面总分"""
     try:
         # 1. 获取请求数据和认证信息
         data = request.get_json()
@@ -795,69 +794,40 @@ def get_player_score():
         if not song_id:
             return jsonify({"error": "未提供歌曲ID"}), 400
 
-        session_token = request.headers['x-access-token']
-        jwt_token = server_sessions.get(session_token)
-        username = get_username_from_jwt(jwt_token)
-
-        if not username:
-            return jsonify({"error": "无法从Token中解析用户名"}), 401
-
-        # 2. 读取本地用户数据文件
-        safe_filename = "".join(c for c in username if c.isalnum() or c in ('_', '-')).rstrip()
-        user_data_path = os.path.join(app.config['USER_DATA_FOLDER'], f"{safe_filename}.json")
+        username = g.username
 
-        if not os.path.exists(user_data_path):
+        # 2. **用户存储改造**: 按 (用户名, 歌曲ID) 走索引查询，只取出这首歌的成绩
+        if load_user_profile(username) is None:
             return jsonify({"error": "未找到该用户的本地数据文件"}), 404
 
-        with open(user_data_path, 'r', encoding='utf-8') as f:
-            user_data = json.load(f)
-        
-        records = user_data.get("records", [])
+        records = user_store.get_scores(username, song_id)
 
-        # 3. 加载歌曲数据库以查找谱面总分
-        songs_json_path = os.path.join(app.root_path, 'songs.json')
-        with open(songs_json_path, 'r', encoding='utf-8') as f:
-            songs_data = json.load(f)
-        
-        # 为了快速查找，创建一个歌曲ID到歌曲信息的映射
-        songs_map = {str(song['id']): song for song in songs_data}
+        # 3. 歌曲库的 (id, type, level_index) 索引用于查找谱面总分
+        catalog = song_catalog.get()
 
-        # 4. 查找所有匹配的成绩记录，并附加上谱面总分
+        # 4. 为每条成绩附加上谱面总分
         scores_data = []
         for record in records:
-            if str(record.get("song_id")) == str(song_id):
-                player_score_type = record.get("type")
-                player_score_level_index = record.get("level_index")
-                
-                # 在歌曲数据库中找到对应的歌曲和谱面
-                song_info = songs_map.get(str(song_id))
-                max_dx_score = 0
-                
-                if song_info and song_info.get('type') == player_score_type:
-                    charts = song_info.get('charts', [])
-                    if 0 <= player_score_level_index < len(charts):
-                        chart_info = charts[player_score_level_index]
-                        notes = chart_info.get('notes', [])
-                        # **终极正确性修复**: 无论notes数组包含4个(SD)还是5个(DX)元素，
-                        # 都将所有元素求和，以得到正确的总物量。
-                        if len(notes) >= 4:
-                            total_notes = sum(notes)
-                            max_dx_score = total_notes * 3
-                
-                scores_data.append({
-                    "achievements": record.get("achievements"),
-                    "dxScore": record.get("dxScore"),
-                    "maxDxScore": max_dx_score, # 新增字段
-                    "fc": record.get("fc"),
-                    "fs": record.get("fs"),
-                    "rate": record.get("rate"),
-                    "level": record.get("level"),
-                    "level_index": record.get("level_index"),
-                    "type": player_score_type
-                })
+            player_score_type = record.get("type")
+            player_score_level_index = record.get("level_index")
+            
+            # 在歌曲数据库中找到对应的谱面
+            chart_info = catalog.get_chart(song_id, player_score_type, player_score_level_index)
+            max_dx_score = 0
+            
+            if chart_info:
+                notes = chart_info.get('notes', [])
+                # **终极正确性修复**: 无论notes数组包含4个(SD)还是5个(DX)元素，
+                # 都将所有元素求和，以得到正确的总物量。
+                if len(notes) >= 4:
+                    total_notes = sum(notes)
+                    max_dx_score = total_notes * 3
+            
+            record["maxDxScore"] = max_dx_score # 新增字段
+            scores_data.append(record)
         
         # 5. 返回所有找到的成绩记录
-        return jsonify(scores_data)
+        return json_bytes_response(scores_data)
 
     except Exception as e:
         print(f"获取玩家成绩时出错: {e}")
@@ -865,10 +835,14 @@ def get_player_score():
         return jsonify({"error": f"发生未知服务器错误: {e}"}), 500
 
 
-@app.route('/search', methods=['POST'])
+@app.route('/search', methods=['GET', 'POST'])
 def search_song():
-    """根据查询词（ID或歌曲名）搜索歌曲"""
-    data = request.get_json()
+    """根据查询词（ID或歌曲名）搜索歌曲；GET 形式 (/search?query=) 可被浏览器按 ETag 缓存"""
+    if request.method == 'GET':
+        data = {'query': request.args['query'], 'strict': request.args.get('strict') == '1'} \
+            if 'query' in request.args else None
+    else:
+        data = request.get_json()
     if not data or 'query' not in data:
         return jsonify({'error': '未提供查询参数'}), 400
     
@@ -876,122 +850,275 @@ def search_song():
     if not query:
         return jsonify({'error': '查询参数为空'}), 400
 
-    # 加载歌曲数据
-    songs_json_path = os.path.join(app.root_path, 'songs.json')
-    with open(songs_json_path, 'r', encoding='utf-8') as f:
-        songs_data = json.load(f)
-
+    # 使用常驻内存的歌曲库
+    catalog = song_catalog.get()
+    result, status_code = resolve_query(query, catalog, strict_alias=data.get('strict') is True)
+    if status_code == 200:
+        body, etag = catalog.serialized(result)
+        if body is not None:
+            return cached_json_response(body, etag)
+    response = jsonify(result)
+    response.status_code = status_code
+    if status_code == 200 and result and result[0].get('ambiguous'):
+        response.headers['X-Alias-Ambiguous'] = '1'
+    return response
+
+def resolve_query(query, catalog, strict_alias=False):
+    """
+    在给定的歌曲库快照上解析一个查询词 (ID或歌曲名/别名)，返回 (结果, 状态码)。
+    /search 与 /api/search/batch 共用该逻辑。
+    别名对应多首歌曲时，与旧版一样返回 aliases.json 中第一首，并在每个版本上标记 ambiguous=True、
+    附带 candidates 列表；strict_alias=True (请求参数 strict) 时改为返回 300 与候选列表。
+    """
     # **终极后端逻辑修复**: 严格区分ID搜索和文本搜索
     if query.isdigit():
         # --- ID 精确搜索路径 ---
         # **终极类型匹配修复**: 直接使用字符串进行比较，不再转换为整数
-        songs_by_id = [song for song in songs_data if song['id'] == query]
+        song = catalog.by_id.get(query)
         
-        if songs_by_id:
-            # 找到了，为每个版本添加封面URL并返回
-            for version in songs_by_id:
-                version['cover_url'] = f"/cover/{version['id']}"
-            return jsonify(songs_by_id)
+        if song:
+            # 找到了 (封面URL已在加载时写入)
+            return [song], 200
         else:
             # 按ID精确搜索但未找到，直接返回404，绝不进行模糊匹配
-            return jsonify({'error': f'本地数据库中未找到ID为 {query} 的歌曲'}), 404
+            return {'error': f'本地数据库中未找到ID为 {query} 的歌曲'}, 404
     else:
         # --- 文本模糊搜索路径 ---
         # **别名搜索**: 首先尝试通过别名精确查找
-        found_by_alias = find_song_by_alias(query, aliases_data, songs_data)
-        if found_by_alias:
-            return jsonify(found_by_alias)
-
-        # 如果别名未找到，再进行模糊匹配
-        found_songs = find_best_match(query, songs_data)
+        alias_titles = find_song_by_alias(query, catalog)
+        if len(alias_titles) == 1:
+            return list(catalog.versions_of(alias_titles[0])), 200
+        if alias_titles:
+            if strict_alias:
+                return alias_collision_response(query, alias_titles, catalog)
+            candidates = alias_candidates(alias_titles, catalog)
+            return [dict(version, ambiguous=True, candidates=candidates)
+                    for version in catalog.versions_of(alias_titles[0])], 200
+
+        # 如果别名未找到，再在标题与别名中进行模糊匹配
+        found_songs = find_best_match(query, catalog, include_aliases=True)
         if found_songs:
-            return jsonify(found_songs)
+            return found_songs, 200
         else:
-            return jsonify({'error': '未找到匹配的歌曲'}), 404
+            return {'error': '未找到匹配的歌曲'}, 404
+
+# --- **批量搜索改造**: 供机器人等批量解析歌名，结果以 NDJSON 逐行返回 ---
+SEARCH_BATCH_MAX_QUERIES = int(os.getenv('SEARCH_BATCH_MAX_QUERIES', '500'))
+
+@app.route('/api/search/batch', methods=['POST'])
+@api_key_required
+def search_batch():
+    """
+    请求体: {"queries": ["歌名或别名或ID", ...], "strict": false}
+    响应: application/x-ndjson，每个查询一行 {"index", "query", "status", "result"}，按输入顺序输出。
+    整批查询使用同一个歌曲库快照，重复的查询只解析一次。
+    """
+    data = request.get_json(silent=True)
+    queries = data.get('queries') if isinstance(data, dict) else None
+    if not isinstance(queries, list) or not queries:
+        return jsonify({'error': '请提供非空的 queries 列表'}), 400
+    if len(queries) > SEARCH_BATCH_MAX_QUERIES:
+        return jsonify({'error': f'单次最多 {SEARCH_BATCH_MAX_QUERIES} 个查询'}), 413
+
+    catalog = song_catalog.get()
+    strict_alias = data.get('strict') is True
+
+    def generate():
+        resolved = {}
+        for index, raw_query in enumerate(queries):
+            query = raw_query.strip() if isinstance(raw_query, str) else ''
+            if not query:
+                result, status_code = {'error': '查询参数为空'}, 400
+            elif query in resolved:
+                result, status_code = resolved[query]
+            else:
+                try:
+                    result, status_code = resolve_query(query, catalog, strict_alias=strict_alias)
+                except Exception as e:
+                    traceback.print_exc()
+                    result, status_code = {'error': f'解析查询时出错: {e}'}, 500
+                resolved[query] = (result, status_code)
+            # 成功结果直接拼接预先编码好的歌曲字节
+            body = catalog.serialized(result)[0] if status_code == 200 else None
+            if body is None:
+                body = fast_json.dumps(result)
+            head = fast_json.dumps({"index": index, "query": raw_query, "status": status_code})
+            yield head[:-1] + b',"result":' + body + b'}\n'
+
+    return Response(generate(), mimetype='application/x-ndjson', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no',
+    })
+
+# --- **输入联想改造**: 搜索框逐键联想 ---
+@app.route('/api/suggest', methods=['GET'])
+def suggest_songs():
+    """按前缀联想标题、别名与歌曲ID，返回精简的 [{id, title, cover_url, match?}, ...]"""
+    started_at = time.perf_counter()
+    query = request.args.get('q', '')
+    limit = request.args.get('limit', SUGGEST_DEFAULT_LIMIT, type=int)
+    limit = max(1, min(SUGGEST_MAX_LIMIT, limit))
+    items = song_catalog.get().suggest_index.suggest(query[:64], limit)
+    response = jsonify(items)
+    # 同一前缀的结果在歌曲库更新前不会变化，允许浏览器短时间缓存
+    response.headers['Cache-Control'] = 'public, max-age=60'
+    response.headers['Server-Timing'] = f"suggest;dur={(time.perf_counter() - started_at) * 1000.0:.3f}"
+    return response
 
 @app.route('/api/aliases/<song_id>', methods=['GET'])
 def get_aliases(song_id):
     """根据歌曲ID查找并返回所有别名"""
     try:
-        # 在别名数据中查找匹配的SongID
-        for details in aliases_data.get('content', []):
-            # **健壮性修复**: 确保比较的是相同类型
-            if str(details.get("SongID")) == str(song_id):
-                return jsonify(details.get("Alias", []))
-        
-        # 如果循环结束都没有找到
-        return jsonify([]) # 返回一个空列表表示没有别名
+        # **别名倒排索引改造**: SongID -> 别名列表，找不到时返回空列表表示没有别名
+        return jsonify(song_catalog.get().alias_index.aliases_for(song_id))
 
     except Exception as e:
         print(f"获取别名时出错: {e}")
         traceback.print_exc()
         return jsonify({"error": "服务器内部错误"}), 500
 
+# --- **零临时文件改造**: 上传图片直接在内存中解码 ---
+def read_upload_image(prefix):
+    """
+    从请求中取出上传的图片并直接在内存中解码，全程不落盘。
+    **快速解码改造**: 只按检测分辨率解码 (见 ingest.py)，返回 (IngestedImage, None) 或 (None, (错误字典, 状态码))。
+    """
+    if 'file' not in request.files:
+        return None, ({'error': 'No file part'}, 400)
+    file = request.files['file']
+    if file.filename == '':
+        return None, ({'error': 'No selected file'}, 400)
+
+    max_bytes = app.config['MAX_UPLOAD_BYTES']
+    data = file.stream.read(max_bytes + 1)
+    if len(data) > max_bytes:
+        return None, ({'error': f'图片过大，最大允许 {max_bytes // (1024 * 1024)} MB'}, 413)
+
+    try:
+        image = ingest_image(data)
+    except ValueError as e:
+        print(f"上传图片解码失败: {e}")
+        return None, ({'error': '无法解析上传的图片，请确认文件为有效的图片格式'}, 400)
+
+    # 监控模式下才保留原始上传文件，供后台管理面板排查
+    if recognizer.is_monitoring_enabled():
+        unique_id = f"{prefix}-{int(time.time())}-{uuid.uuid4().hex[:6]}"
+        try:
+            with open(os.path.join(app.config['UPLOAD_FOLDER'], f"{unique_id}.jpg"), 'wb') as f:
+                f.write(data)
+        except Exception as e:
+            print(f"监控模式保存上传文件失败: {e}")
+
+    return image, None
+
+@app.errorhandler(413)
+def request_entity_too_large(e):
+    max_bytes = app.config['MAX_UPLOAD_BYTES']
+    return jsonify({'error': f'图片过大，最大允许 {max_bytes // (1024 * 1024)} MB'}), 413
+
 # --- **API封装改造**: 新的受保护的API端点 ---
 @app.route('/api/recognize', methods=['POST'])
 @api_key_required
 def api_recognize():
-    if 'file' not in request.files:
-        return jsonify({'error': 'No file part'}), 400
-    
-    file = request.files['file']
-    if file.filename == '':
-        return jsonify({'error': 'No selected file'}), 400
+    # 1. 在内存中读取并解码图片
+    image, error = read_upload_image("api")
+    if error:
+        return jsonify(error[0]), error[1]
 
-    # 1. 保存临时文件
-    unique_id = f"api-{int(time.time())}-{uuid.uuid4().hex[:6]}"
-    filename = f"{unique_id}.jpg"
-    filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-    file.save(filepath)
+    # 2. 调用核心处理函数
+    result, status_code = recognize_song_from_image(image)
+    return jsonify(result), status_code
 
+# --- **异步识别改造**: 提交任务后立即返回任务ID，客户端轮询或通过SSE获取结果 ---
+def _run_recognition_job(image):
     try:
-        # 2. 调用核心处理函数
-        result, status_code = recognize_song_from_image(filepath)
-        return jsonify(result), status_code
-    finally:
-        # 3. 清理临时文件
-        if os.path.exists(filepath):
-            try:
-                os.remove(filepath)
-            except Exception as e:
-                print(f"Error deleting API temp file '{filepath}': {e}")
+        return recognize_song_from_image(image)
+    except RecognitionQueueFull:
+        return {'error': '服务器繁忙，识别队列已满，请稍后重试'}, 503
+
+recognition_jobs = RecognitionJobStore(
+    _run_recognition_job,
+    workers=int(os.getenv('JOB_WORKERS', '4')),
+    max_pending=int(os.getenv('JOB_MAX_PENDING', '64')),
+    result_ttl=int(os.getenv('JOB_RESULT_TTL', '300')),
+)
+
+@app.route('/api/recognize/jobs', methods=['POST'])
+@api_key_required
+def api_create_recognize_job():
+    image, error = read_upload_image("job")
+    if error:
+        return jsonify(error[0]), error[1]
+
+    try:
+        job = recognition_jobs.submit(image)
+    except JobStoreFull:
+        response = jsonify({'error': '服务器繁忙，待处理的识别任务过多，请稍后重试'})
+        response.status_code = 503
+        response.headers['Retry-After'] = '5'
+        return response
+
+    response = jsonify({
+        "job_id": job.job_id,
+        "status": job.status,
+        "status_url": f"/api/recognize/jobs/{job.job_id}",
+        "stream_url": f"/api/recognize/jobs/{job.job_id}/stream",
+    })
+    response.status_code = 202
+    response.headers['Location'] = f"/api/recognize/jobs/{job.job_id}"
+    return response
+
+@app.route('/api/recognize/jobs/<job_id>', methods=['GET'])
+@api_key_required
+def api_get_recognize_job(job_id):
+    job = recognition_jobs.get(job_id)
+    if not job:
+        return jsonify({'error': '任务不存在或结果已过期'}), 404
+    return jsonify(job.to_dict())
+
+@app.route('/api/recognize/jobs/<job_id>/stream', methods=['GET'])
+@api_key_required
+def api_stream_recognize_job(job_id):
+    """以 Server-Sent Events 推送任务结果；等待期间定期发送心跳，防止代理断开连接"""
+    job = recognition_jobs.get(job_id)
+    if not job:
+        return jsonify({'error': '任务不存在或结果已过期'}), 404
+
+    def generate():
+        yield f"event: status\ndata: {json.dumps({'job_id': job.job_id, 'status': job.status})}\n\n"
+        deadline = time.time() + RECOGNITION_JOB_TIMEOUT + 30
+        while not job.done_event.wait(timeout=15):
+            if time.time() > deadline:
+                yield f"event: error\ndata: {json.dumps({'error': '等待任务结果超时'}, ensure_ascii=False)}\n\n"
+                return
+            yield ": keep-alive\n\n"
+        yield f"event: result\ndata: {json.dumps(job.to_dict(), ensure_ascii=False)}\n\n"
+
+    return Response(generate(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no',
+    })
 
 @app.route('/upload', methods=['POST'])
 def upload_file():
-    if 'file' not in request.files:
-        return jsonify({'error': 'No file part'}), 400
-    file = request.files['file']
-    if file.filename == '':
-        return jsonify({'error': 'No selected file'}), 400
-    
-    # 1. 保存临时文件
-    unique_id = f"web-{int(time.time())}-{uuid.uuid4().hex[:6]}"
-    filename = f"{unique_id}.jpg"
-    filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-    file.save(filepath)
+    # 1. 在内存中读取并解码图片
+    image, error = read_upload_image("web")
+    if error:
+        return jsonify(error[0]), error[1]
 
-    try:
-        # 2. 调用核心处理函数
-        result, status_code = recognize_song_from_image(filepath)
-# 3. **兼容性修复**: 如果是网页端上传，对于OCR识别失败的情况，返回一个特定的JSON，
-        #    而不是像API那样返回404，这样可以触发前端的重试逻辑。
-        if status_code == 404 and result.get("error") == "OCR did not recognize any text from the best crop.":
-            return jsonify({"error": "OCR did not recognize any text from the best crop."}) # 注意: 这里没有状态码，让Flask默认为200
-        
-        # **兼容性修复**: 对于 "未能识别到歌曲名" 的情况，也同样处理
-        if status_code == 404 and result.get("error") == "未能识别到歌曲名，请尝试调整拍摄角度，确保画面清晰、无反光。":
-             return jsonify({"error": "未能识别到歌曲名，请尝试调整拍摄角度，确保画面清晰、无反光。"})
+    # 2. 调用核心处理函数
+    result, status_code = recognize_song_from_image(image)
+    # 3. **兼容性修复**: 如果是网页端上传，对于OCR识别失败的情况，返回一个特定的JSON，
+    #    而不是像API那样返回404，这样可以触发前端的重试逻辑。
+    if status_code == 404 and result.get("error") == "OCR did not recognize any text from the best crop.":
+        return jsonify({"error": "OCR did not recognize any text from the best crop."}) # 注意: 这里没有状态码，让Flask默认为200
 
-        # 对于其他所有情况，正常返回结果和状态码
-        return jsonify(result), status_code
+    # **兼容性修复**: 对于 "未能识别到歌曲名" 的情况，也同样处理
+    if status_code == 404 and result.get("error") == "未能识别到歌曲名，请尝试调整拍摄角度，确保画面清晰、无反光。":
+         return jsonify({"error": "未能识别到歌曲名，请尝试调整拍摄角度，确保画面清晰、无反光。"})
 
-    finally:
-        # 4. 清理临时文件
-        if os.path.exists(filepath):
-            try:
-                os.remove(filepath)
-            except Exception as e:
-                print(f"Error deleting web upload temp file '{filepath}': {e}")
+    # 对于其他所有情况，正常返回结果和状态码
+    return jsonify(result), status_code
 
 # --- **留言板改造**: 新增反馈接口 ---
 @app.route('/api/feedback', methods=['POST'])
@@ -1051,8 +1178,6 @@ def submit_feedback():
 if __name__ == '__main__':
     # 当使用Waitress等生产服务器启动时，
     # 这个 __main__ 块通常不会被执行。
-    # 但为了保持直接运行 `python app.py` 进行基本检查的可能性（虽然不推荐），
-    # 我们可以保留会话恢复的调用。
+    # 会话存储在导入模块时已经初始化 (见 restore_sessions_on_startup)。
     # app.run() 必须被移除或注释掉，因为它将被waitress-serve替代。
-    restore_sessions_on_startup()
     print("应用已准备好，请通过 'waitress-serve' 命令来启动。")
@@ -0,0 +1,135 @@
+import os
+import threading
+import time
+import uuid
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# --- **封面下载改造**: 共享的封面下载与缓存 ---
+# 主程序的 /cover 路由与后台管理面板的预热任务都通过这里访问 covers/ 缓存目录。
+
+COVER_URL_TEMPLATE = "https://www.diving-fish.com/covers/{}.png"
+
+
+def get_cover_len5_id(mid) -> str:
+    """将歌曲ID转换为符合水鱼API要求的5位数ID字符串"""
+    mid = int(mid)
+    if 10001 <= mid <= 11000:
+        mid -= 10000
+    return f"{mid:05d}"
+
+
+class CoverFetcher:
+    """
+    封面缓存的读取与下载:
+    - 所有下载共用一个带连接池的 keep-alive Session，并设置连接/读取超时；
+    - 同一封面的并发请求只触发一次下载 (single-flight)，其余请求等待这次下载的结果；
+    - 下载内容先写入临时文件再 os.replace，其他请求不会读到写了一半的图片；
+    - 远端不存在的封面记入负缓存，negative_ttl 秒内不再请求；网络错误按 error_ttl 短暂缓存。
+    """
+
+    def __init__(self, cache_dir, connect_timeout=3.0, read_timeout=10.0,
+                 negative_ttl=3600, error_ttl=30, pool_size=32):
+        self.cache_dir = cache_dir
+        self.timeout = (connect_timeout, read_timeout)
+        self.negative_ttl = negative_ttl
+        self.error_ttl = error_ttl
+        os.makedirs(cache_dir, exist_ok=True)
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+        self._lock = threading.Lock()
+        self._inflight = {}
+        self._negative = {}
+        self._stats = {"hits": 0, "downloads": 0, "shared_waits": 0,
+                       "negative_hits": 0, "not_found": 0, "errors": 0}
+
+    def cover_filename(self, song_id):
+        return f"{get_cover_len5_id(song_id)}.png"
+
+    def cached_path(self, song_id):
+        """已缓存时返回本地路径，否则返回 None (不触发下载)"""
+        path = os.path.join(self.cache_dir, self.cover_filename(song_id))
+        return path if os.path.exists(path) else None
+
+    def _count(self, key):
+        with self._lock:
+            self._stats[key] += 1
+
+    def get(self, song_id):
+        """返回封面的本地缓存路径；远端不存在或下载失败时返回 None。song_id 非法时抛出 ValueError"""
+        cover_id = get_cover_len5_id(song_id)
+        path = os.path.join(self.cache_dir, f"{cover_id}.png")
+        if os.path.exists(path):
+            self._count("hits")
+            return path
+
+        with self._lock:
+            expires_at = self._negative.get(cover_id)
+            if expires_at is not None:
+                if expires_at > time.monotonic():
+                    self._stats["negative_hits"] += 1
+                    return None
+                del self._negative[cover_id]
+            event = self._inflight.get(cover_id)
+            is_leader = event is None
+            if is_leader:
+                event = threading.Event()
+                self._inflight[cover_id] = event
+            else:
+                self._stats["shared_waits"] += 1
+
+        if not is_leader:
+            # 等待正在进行的同一次下载
+            event.wait(timeout=sum(self.timeout) + 5)
+            return path if os.path.exists(path) else None
+
+        try:
+            return path if self._download(cover_id, path) else None
+        finally:
+            with self._lock:
+                del self._inflight[cover_id]
+            event.set()
+
+    def _download(self, cover_id, path):
+        url = COVER_URL_TEMPLATE.format(cover_id)
+        tmp_path = f"{path}.{uuid.uuid4().hex[:8]}.tmp"
+        try:
+            with self.session.get(url, stream=True, timeout=self.timeout) as response:
+                if response.status_code == 404:
+                    self._remember_missing(cover_id, self.negative_ttl, "not_found")
+                    return False
+                response.raise_for_status()
+                with open(tmp_path, 'wb') as f:
+                    for chunk in response.iter_content(chunk_size=64 * 1024):
+                        f.write(chunk)
+            os.replace(tmp_path, path)
+            self._count("downloads")
+            return True
+        except Exception as e:
+            print(f"下载封面 {cover_id} 失败: {e}")
+            self._remember_missing(cover_id, self.error_ttl, "errors")
+            return False
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def _remember_missing(self, cover_id, ttl, stat_key):
+        with self._lock:
+            self._stats[stat_key] += 1
+            if ttl > 0:
+                now = time.monotonic()
+                # 非法ID也会进入负缓存，条目过多时顺带清理已过期的部分
+                if len(self._negative) >= 4096:
+                    self._negative = {key: exp for key, exp in self._negative.items() if exp > now}
+                self._negative[cover_id] = now + ttl
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats.update({"inflight": len(self._inflight), "negative_entries": len(self._negative)})
+        return stats
@@ -0,0 +1,278 @@
+import hashlib
+import hmac
+import io
+import math
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image, features
+
+from cover_fetcher import get_cover_len5_id
+from cover_variants import content_etag
+
+# --- **封面雪碧图改造**: 把一组封面拼成一张缩略图 ---
+# B50 页面原本要为最多50首歌分别请求 /cover/<id>。现在按封面ID排序去重后拼成一张图，
+# 同一组歌曲 (无论顺序) 得到同一张图，页面只需要一次图片请求，再用偏移表定位每首歌的封面。
+# 拼接一张图最多要下载 max_ids 个封面，因此图片地址带有服务端签名，只接受由 describe() 生成的ID组合。
+
+SPRITE_FORMATS = {'webp': ('image/webp', {'quality': 80, 'method': 4}),
+                  'png': ('image/png', {'optimize': True})}
+
+
+class CoverSpriteCache:
+    """
+    雪碧图的生成与磁盘缓存:
+    - 歌曲ID先经 get_cover_len5_id 映射为封面ID，SD/DX 共用的封面只占一格；
+    - 以 (排序后的封面ID, 格子宽度, 格式) 为键缓存在 cache_dir，最多保留 max_entries 张，超出时删除最久未用的；
+      重启时按文件修改时间恢复已有的缓存；
+    - 有封面缺失时用占位图填充，这样的雪碧图只在内存中保留 incomplete_ttl 秒，过期后重新拼接。
+    """
+
+    def __init__(self, cover_fetcher, cache_dir, placeholder_path, secret, columns=10, max_ids=60,
+                 max_entries=256, fetch_workers=8, incomplete_ttl=30):
+        self.cover_fetcher = cover_fetcher
+        self.cache_dir = cache_dir
+        self.placeholder_path = placeholder_path
+        # 签名密钥由 secret 派生，签名不会泄露 secret 本身，也与 secret 的其他用途互不相关
+        self.signing_key = hmac.new(secret, b"cover-sprite", hashlib.sha256).digest()
+        self.formats = [name for name in SPRITE_FORMATS if name == 'png' or features.check(name)]
+        self.columns = columns
+        self.max_ids = max_ids
+        self.max_entries = max_entries
+        self.incomplete_ttl = incomplete_ttl
+        self._executor = ThreadPoolExecutor(max_workers=fetch_workers)
+        self._lock = threading.Lock()
+        self._inflight = {}  # 缓存键 -> 正在拼接的请求完成时触发的 Event
+        self._entries = OrderedDict()  # 缓存键 -> (文件路径, ETag)
+        self._incomplete = {}  # 缓存键 -> (图片字节, ETag, 过期时间)
+        self._stats = {"hits": 0, "built": 0, "shared_waits": 0, "incomplete": 0, "evicted": 0, "bad_signatures": 0}
+
+        os.makedirs(cache_dir, exist_ok=True)
+        self._load_existing()
+
+    def _load_existing(self):
+        """按修改时间 (近似最近使用顺序) 恢复磁盘上的雪碧图，清理写了一半的临时文件"""
+        files = []
+        for filename in os.listdir(self.cache_dir):
+            path = os.path.join(self.cache_dir, filename)
+            key, _, format_name = filename.partition('.')
+            try:
+                if format_name not in SPRITE_FORMATS:
+                    if filename.endswith('.tmp'):
+                        os.remove(path)
+                    continue
+                files.append((os.path.getmtime(path), key, format_name, path))
+            except OSError:
+                pass
+        for _, key, format_name, path in sorted(files)[-self.max_entries:]:
+            try:
+                with open(path, 'rb') as f:
+                    self._entries[key] = (path, content_etag(f.read()))
+            except OSError:
+                pass
+
+    def normalize(self, song_ids):
+        """
+        返回 (排序去重后的封面ID列表, 封面ID -> 歌曲ID列表)。
+        ID 非法或数量超过 max_ids 时抛出 ValueError。
+        """
+        songs_by_cover = {}
+        for song_id in song_ids:
+            song_id = str(song_id).strip()
+            if not song_id:
+                continue
+            try:
+                cover_id = get_cover_len5_id(song_id)
+            except ValueError:
+                raise ValueError(f"无效的歌曲ID: {song_id}")
+            songs_by_cover.setdefault(cover_id, []).append(song_id)
+        if not songs_by_cover:
+            raise ValueError("没有提供歌曲ID。")
+        if len(songs_by_cover) > self.max_ids:
+            raise ValueError(f"单张雪碧图最多包含 {self.max_ids} 个封面。")
+        return sorted(songs_by_cover), songs_by_cover
+
+    def layout(self, count):
+        columns = min(self.columns, count)
+        rows = math.ceil(count / columns)
+        return columns, rows
+
+    def negotiate(self, accepted_mimetypes):
+        """客户端接受且当前 Pillow 支持 WebP 时使用 WebP，否则使用 PNG"""
+        if 'webp' in self.formats and SPRITE_FORMATS['webp'][0] in accepted_mimetypes:
+            return 'webp'
+        return 'png'
+
+    def sign(self, cover_ids, tile):
+        message = f"{','.join(cover_ids)}|{tile}".encode('utf-8')
+        return hmac.new(self.signing_key, message, hashlib.sha256).hexdigest()[:20]
+
+    def describe(self, song_ids, tile):
+        """返回雪碧图的地址 (带签名) 与偏移表 (只做计算，不生成图片)"""
+        cover_ids, songs_by_cover = self.normalize(song_ids)
+        columns, rows = self.layout(len(cover_ids))
+        offsets = {}
+        for index, cover_id in enumerate(cover_ids):
+            position = [(index % columns) * tile, (index // columns) * tile]
+            for song_id in songs_by_cover[cover_id]:
+                offsets[song_id] = position
+        return {
+            "url": f"/api/covers/sprite?ids={','.join(cover_ids)}&w={tile}&sig={self.sign(cover_ids, tile)}",
+            "tile": tile, "columns": columns, "rows": rows,
+            "width": columns * tile, "height": rows * tile,
+            "offsets": offsets,
+        }
+
+    def get(self, song_ids, tile, format_name, signature):
+        """
+        返回 (图片字节, MIME类型, ETag, 是否完整)。
+        signature 须与 describe() 生成的一致，否则抛出 PermissionError。
+        """
+        cover_ids, _ = self.normalize(song_ids)
+        if not hmac.compare_digest(str(signature or ''), self.sign(cover_ids, tile)):
+            with self._lock:
+                self._stats["bad_signatures"] += 1
+            raise PermissionError("雪碧图地址无效，请通过 /api/covers/sprite/map 获取。")
+        mimetype, save_params = SPRITE_FORMATS[format_name]
+        key = hashlib.sha1(f"{','.join(cover_ids)}|{tile}|{format_name}".encode('utf-8')).hexdigest()[:24]
+
+        cached = self._cached(key)
+        if cached is not None:
+            return cached[0], mimetype, cached[1], cached[2]
+
+        # single-flight: 同一张雪碧图同时只拼接一次，其余请求等待结果
+        with self._lock:
+            event = self._inflight.get(key)
+            is_leader = event is None
+            if is_leader:
+                event = threading.Event()
+                self._inflight[key] = event
+            else:
+                self._stats["shared_waits"] += 1
+        if not is_leader:
+            event.wait(timeout=60)
+            cached = self._cached(key)
+            if cached is not None:
+                return cached[0], mimetype, cached[1], cached[2]
+            # 领头的请求失败 (或不缓存不完整的图) 时自行拼接
+            data, complete = self._build(cover_ids, tile, format_name, save_params)
+            return data, mimetype, content_etag(data), complete
+
+        try:
+            data, complete = self._build(cover_ids, tile, format_name, save_params)
+            etag = content_etag(data)
+            if complete:
+                self._store(key, format_name, data, etag)
+            else:
+                self._store_incomplete(key, data, etag)
+            return data, mimetype, etag, complete
+        finally:
+            with self._lock:
+                del self._inflight[key]
+            event.set()
+
+    def _cached(self, key):
+        """返回 (图片字节, ETag, 是否完整)；没有缓存时返回 None"""
+        cached = self._lookup(key)
+        if cached is not None:
+            path, etag = cached
+            try:
+                with open(path, 'rb') as f:
+                    data = f.read()
+            except OSError:
+                return None
+            with self._lock:
+                self._stats["hits"] += 1
+            return data, etag, True
+        incomplete = self._lookup_incomplete(key)
+        if incomplete is not None:
+            return incomplete[0], incomplete[1], False
+        return None
+
+    def _lookup(self, key):
+        with self._lock:
+            cached = self._entries.get(key)
+            if cached is not None:
+                self._entries.move_to_end(key)
+            return cached
+
+    def _lookup_incomplete(self, key):
+        with self._lock:
+            cached = self._incomplete.get(key)
+            if cached is None:
+                return None
+            if cached[2] <= time.monotonic():
+                del self._incomplete[key]
+                return None
+            self._stats["hits"] += 1
+            return cached
+
+    def _store_incomplete(self, key, data, etag):
+        """缺少封面的雪碧图只在内存中短暂保留，避免同一页面的重复请求反复拼接与下载"""
+        now = time.monotonic()
+        with self._lock:
+            self._stats["incomplete"] += 1
+            if self.incomplete_ttl <= 0:
+                return
+            for old_key in [k for k, cached in self._incomplete.items() if cached[2] <= now]:
+                del self._incomplete[old_key]
+            if len(self._incomplete) < self.max_entries:
+                self._incomplete[key] = (data, etag, now + self.incomplete_ttl)
+
+    def _store(self, key, format_name, data, etag):
+        path = os.path.join(self.cache_dir, f"{key}.{format_name}")
+        tmp_path = f"{path}.{uuid.uuid4().hex[:8]}.tmp"
+        try:
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        entry = (path, etag)
+        evicted = []
+        with self._lock:
+            self._entries[key] = entry
+            self._stats["built"] += 1
+            while len(self._entries) > self.max_entries:
+                evicted.append(self._entries.popitem(last=False)[1][0])
+                self._stats["evicted"] += 1
+        for old_path in evicted:
+            try:
+                os.remove(old_path)
+            except OSError:
+                pass
+        return entry
+
+    def _build(self, cover_ids, tile, format_name, save_params):
+        # 缺失的封面并发下载 (CoverFetcher 内部对同一封面去重)
+        paths = list(self._executor.map(self.cover_fetcher.get, cover_ids))
+        columns, rows = self.layout(len(cover_ids))
+        sprite = Image.new('RGB', (columns * tile, rows * tile), (255, 255, 255))
+        complete = True
+        for index, path in enumerate(paths):
+            if path is None:
+                complete = False
+                path = self.placeholder_path
+            try:
+                with Image.open(path) as cover:
+                    tile_image = cover.convert('RGB').resize((tile, tile), Image.LANCZOS)
+            except Exception as e:
+                print(f"拼接雪碧图时读取封面 {cover_ids[index]} 失败: {e}")
+                complete = False
+                continue
+            sprite.paste(tile_image, ((index % columns) * tile, (index // columns) * tile))
+        buffer = io.BytesIO()
+        sprite.save(buffer, format=format_name.upper(), **save_params)
+        return buffer.getvalue(), complete
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = len(self._entries)
+            stats["incomplete_entries"] = len(self._incomplete)
+        return stats
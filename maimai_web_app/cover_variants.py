@@ -0,0 +1,130 @@
+import hashlib
+import os
+import threading
+import uuid
+
+from PIL import Image, features
+
+# --- **封面缩略图改造**: 按宽度生成的 WebP/AVIF 封面变体 ---
+# 页面上的封面基本都以小缩略图显示，原图 PNG 对移动端来说太大。
+# 每个 (封面, 宽度, 格式) 组合只在第一次请求时生成一次，与原图一起保存在 covers/ 目录下，
+# 例如 covers/00834.w96.webp。
+
+# 可选格式，按优先级排列: (格式名, MIME类型, Pillow保存参数)
+VARIANT_FORMATS = (
+    ('avif', 'image/avif', {'quality': 60}),
+    ('webp', 'image/webp', {'quality': 80, 'method': 4}),
+    ('png', 'image/png', {'optimize': True}),
+)
+VARIANT_MIMETYPES = {name: mimetype for name, mimetype, _ in VARIANT_FORMATS}
+
+
+def _supports(format_name):
+    if format_name == 'png':
+        return True
+    try:
+        return bool(features.check(format_name))
+    except Exception:
+        return False
+
+
+def content_etag(data):
+    return hashlib.sha1(data).hexdigest()[:20]
+
+
+class CoverVariants:
+    """
+    封面变体的生成与查找:
+    - 请求的宽度会被归到 widths 中不小于它的最小一档 (超过最大档时取最大档)，防止任意尺寸占满磁盘；
+    - 格式根据客户端 Accept 协商: AVIF > WebP > PNG，当前 Pillow 不支持的格式自动跳过；
+    - ETag 取文件内容的哈希，内容不变则 ETag 不变，可以放心使用 immutable 缓存。
+    """
+
+    def __init__(self, cache_dir, widths=(96, 200)):
+        self.cache_dir = cache_dir
+        self.widths = sorted(set(widths))
+        self.formats = [name for name, _, _ in VARIANT_FORMATS if _supports(name)]
+        self._save_params = {name: params for name, _, params in VARIANT_FORMATS}
+        self._lock = threading.Lock()
+        self._key_locks = {}
+        # 路径 -> ((mtime_ns, size), etag)，避免每次请求都重新计算哈希
+        self._etags = {}
+        self._stats = {"generated": 0, "served": 0}
+
+    def snap_width(self, width):
+        for allowed in self.widths:
+            if width <= allowed:
+                return allowed
+        return self.widths[-1]
+
+    def negotiate(self, accepted_mimetypes):
+        """从客户端接受的MIME类型集合中选出最优的格式"""
+        for name in self.formats:
+            if VARIANT_MIMETYPES[name] in accepted_mimetypes:
+                return name
+        return 'png'
+
+    def variant_path(self, original_path, width, format_name):
+        stem, _ = os.path.splitext(original_path)
+        return f"{stem}.w{width}.{format_name}"
+
+    def get(self, original_path, width, format_name):
+        """返回 (变体路径, MIME类型, ETag)；变体不存在时由原图生成"""
+        width = self.snap_width(width)
+        path = self.variant_path(original_path, width, format_name)
+        if not self._is_fresh(path, original_path):
+            with self._lock:
+                key_lock = self._key_locks.setdefault(path, threading.Lock())
+            with key_lock:
+                if not self._is_fresh(path, original_path):
+                    self._generate(original_path, path, width, format_name)
+        with self._lock:
+            self._stats["served"] += 1
+        return path, VARIANT_MIMETYPES[format_name], self.etag_for(path)
+
+    @staticmethod
+    def _is_fresh(path, original_path):
+        """变体存在且不早于原图 (原图被重新下载后需要重新生成)"""
+        try:
+            return os.path.getmtime(path) >= os.path.getmtime(original_path)
+        except OSError:
+            return False
+
+    def _generate(self, original_path, path, width, format_name):
+        with Image.open(original_path) as image:
+            image.load()
+            if image.mode not in ('RGB', 'RGBA'):
+                image = image.convert('RGBA' if 'transparency' in image.info or image.mode in ('LA', 'PA') else 'RGB')
+            if image.width > width:
+                height = max(1, round(image.height * width / image.width))
+                image = image.resize((width, height), Image.LANCZOS)
+            # 先写临时文件再 os.replace，并发读取的请求不会拿到写了一半的图片
+            tmp_path = f"{path}.{uuid.uuid4().hex[:8]}.tmp"
+            try:
+                image.save(tmp_path, format=format_name.upper(), **self._save_params[format_name])
+                os.replace(tmp_path, path)
+            finally:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+        with self._lock:
+            self._stats["generated"] += 1
+
+    def etag_for(self, path):
+        """文件内容哈希作为 ETag (按 mtime 与大小缓存)"""
+        stat = os.stat(path)
+        signature = (stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            cached = self._etags.get(path)
+        if cached and cached[0] == signature:
+            return cached[1]
+        with open(path, 'rb') as f:
+            etag = content_etag(f.read())
+        with self._lock:
+            self._etags[path] = (signature, etag)
+        return etag
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats.update({"widths": self.widths, "formats": self.formats})
+        return stats
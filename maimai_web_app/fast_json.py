@@ -0,0 +1,15 @@
+import json
+
+# --- **预序列化改造**: JSON 编码入口 ---
+# 安装了 orjson 时使用它 (C实现，直接输出UTF-8字节)，否则退回标准库 json，输出保持一致。
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def dumps(obj):
+    """把对象编码为紧凑的UTF-8 JSON字节"""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(obj, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
@@ -0,0 +1,133 @@
+import queue
+import threading
+import time
+import traceback
+
+
+class _PendingPrediction:
+    """一次等待批处理的YOLO预测请求"""
+    __slots__ = ('image', 'kwargs_key', 'enqueued_at', 'event', 'result', 'error')
+
+    def __init__(self, image, kwargs_key):
+        self.image = image
+        self.kwargs_key = kwargs_key
+        self.enqueued_at = time.perf_counter()
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class YoloBatchScheduler:
+    """
+    **跨请求批处理改造**: 位于 yolo_model 前面的推理调度器。
+    waitress 的多个线程并发调用 predict() 时，调度线程会在 max_wait_ms 内
+    把请求攒成最多 max_batch_size 张图的一批，用一次 model.predict 完成推理，
+    再把每张图的 Results 分发回各自的调用方。
+    首轮与二次预测都走这里，参数 (如 imgsz) 不同的请求会被分到不同的批次。
+    """
+
+    def __init__(self, model, max_batch_size=8, max_wait_ms=10):
+        self.model = model
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self._queue = queue.Queue()
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            "requests": 0,
+            "batches": 0,
+            "errors": 0,
+            "batch_size_histogram": {},
+            "queue_wait_total_ms": 0.0,
+            "queue_wait_max_ms": 0.0,
+            "predict_total_ms": 0.0,
+        }
+        self._thread = threading.Thread(target=self._dispatch_loop, name="yolo-batch-scheduler")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def predict(self, image, **predict_kwargs):
+        """提交一张图片 (路径或BGR ndarray)，阻塞直到所在批次完成，返回该图片的 Results"""
+        kwargs_key = tuple(sorted(predict_kwargs.items()))
+        pending = _PendingPrediction(image, kwargs_key)
+        self._queue.put(pending)
+        pending.event.wait()
+        if pending.error is not None:
+            raise pending.error
+        return pending.result
+
+    def _collect_batch(self):
+        """阻塞取出第一个请求，然后在最大等待时间内尽量凑满一批"""
+        batch = [self._queue.get()]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                if remaining <= 0:
+                    # 等待时间已到，但仍把已经在排队的请求一并带走
+                    batch.append(self._queue.get_nowait())
+                else:
+                    batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _dispatch_loop(self):
+        while True:
+            batch = self._collect_batch()
+            groups = {}
+            for pending in batch:
+                groups.setdefault(pending.kwargs_key, []).append(pending)
+            for kwargs_key, group in groups.items():
+                self._run_group(group, dict(kwargs_key))
+
+    def _run_group(self, group, predict_kwargs):
+        started_at = time.perf_counter()
+        waits_ms = [(started_at - p.enqueued_at) * 1000.0 for p in group]
+        try:
+            results = self.model.predict(source=[p.image for p in group], **predict_kwargs)
+            for pending, result in zip(group, results):
+                pending.result = result
+        except BaseException as e:
+            print(f"YOLO批处理推理失败 (batch={len(group)}): {e}")
+            traceback.print_exc()
+            for pending in group:
+                pending.error = e
+        finally:
+            predict_ms = (time.perf_counter() - started_at) * 1000.0
+            self._record(group, waits_ms, predict_ms)
+            for pending in group:
+                pending.event.set()
+
+    def _record(self, group, waits_ms, predict_ms):
+        size = len(group)
+        with self._stats_lock:
+            stats = self._stats
+            stats["requests"] += size
+            stats["batches"] += 1
+            if any(p.error is not None for p in group):
+                stats["errors"] += 1
+            stats["batch_size_histogram"][size] = stats["batch_size_histogram"].get(size, 0) + 1
+            stats["queue_wait_total_ms"] += sum(waits_ms)
+            stats["queue_wait_max_ms"] = max(stats["queue_wait_max_ms"], max(waits_ms))
+            stats["predict_total_ms"] += predict_ms
+
+    def get_stats(self):
+        """返回批大小与排队等待时间的统计信息"""
+        with self._stats_lock:
+            stats = dict(self._stats)
+            histogram = dict(stats.pop("batch_size_histogram"))
+        requests_count = stats["requests"]
+        batches = stats["batches"]
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000.0,
+            "queue_depth": self._queue.qsize(),
+            "requests": requests_count,
+            "batches": batches,
+            "errors": stats["errors"],
+            "avg_batch_size": round(requests_count / batches, 3) if batches else 0.0,
+            "batch_size_histogram": {str(k): v for k, v in sorted(histogram.items())},
+            "avg_queue_wait_ms": round(stats["queue_wait_total_ms"] / requests_count, 3) if requests_count else 0.0,
+            "max_queue_wait_ms": round(stats["queue_wait_max_ms"], 3),
+            "avg_predict_ms_per_batch": round(stats["predict_total_ms"] / batches, 3) if batches else 0.0,
+        }
@@ -0,0 +1,144 @@
+import hashlib
+import io
+import os
+
+import cv2
+import numpy as np
+from PIL import Image
+
+# --- **快速解码改造**: 上传图片的解码入口 ---
+# 手机拍摄的屏幕照片动辄 12~50MP，而检测器只在 640 左右的分辨率上工作。
+# 这里借助 JPEG 的 DCT 缩放 (OpenCV IMREAD_REDUCED_*) 直接解码出接近检测分辨率的小图，
+# 只有标题等小区域才从一份较高分辨率的解码结果中裁剪，交给OCR。
+
+# 检测用图像的长边下限 (会选择不小于该尺寸的最大DCT缩放比例)
+INGEST_DETECT_LONG_SIDE = int(os.getenv('INGEST_DETECT_LONG_SIDE', '640'))
+# OCR 裁剪所用图像的长边下限
+INGEST_OCR_LONG_SIDE = int(os.getenv('INGEST_OCR_LONG_SIDE', '1600'))
+
+
+_REDUCED_JPEG_FLAGS = (
+    (8, cv2.IMREAD_REDUCED_COLOR_8),
+    (4, cv2.IMREAD_REDUCED_COLOR_4),
+    (2, cv2.IMREAD_REDUCED_COLOR_2),
+)
+
+
+def _read_header(data):
+    """只解析图片头部，返回 (格式, (宽, 高), EXIF方向)"""
+    with Image.open(io.BytesIO(data)) as img:
+        orientation = img.getexif().get(0x0112, 1) if img.format == 'JPEG' else 1
+        return img.format, img.size, orientation
+
+
+def _apply_exif_orientation(image, orientation):
+    """按EXIF Orientation 标签把图像转正 (与 PIL.ImageOps.exif_transpose 的变换一致)"""
+    if orientation == 2:
+        return cv2.flip(image, 1)
+    if orientation == 3:
+        return cv2.rotate(image, cv2.ROTATE_180)
+    if orientation == 4:
+        return cv2.flip(image, 0)
+    if orientation == 5:
+        return cv2.transpose(image)
+    if orientation == 6:
+        return cv2.rotate(image, cv2.ROTATE_90_CLOCKWISE)
+    if orientation == 7:
+        return cv2.flip(cv2.transpose(image), -1)
+    if orientation == 8:
+        return cv2.rotate(image, cv2.ROTATE_90_COUNTERCLOCKWISE)
+    return image
+
+
+def _decode(data, long_side, header=None):
+    """
+    以不小于 long_side 的分辨率解码图片并应用EXIF方向，返回BGR ndarray。
+    JPEG 利用 libjpeg 的 DCT 缩放 (1/2、1/4、1/8) 直接解码出小图；其他格式完整解码后再按需缩小。
+    """
+    image_format, (width, height), orientation = header or _read_header(data)
+    flags = cv2.IMREAD_COLOR | cv2.IMREAD_IGNORE_ORIENTATION
+    if image_format == 'JPEG':
+        for factor, reduced_flag in _REDUCED_JPEG_FLAGS:
+            if max(width, height) / factor >= long_side:
+                flags = reduced_flag | cv2.IMREAD_IGNORE_ORIENTATION
+                break
+    image = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), flags)
+    if image is None:
+        raise ValueError("图片数据无法解码")
+    image = _apply_exif_orientation(image, orientation)
+    current_long_side = max(image.shape[:2])
+    # 非JPEG或DCT缩放后仍明显偏大时，再用面积插值缩小到目标尺寸附近
+    if current_long_side > long_side * 2:
+        scale = long_side / float(current_long_side)
+        image = cv2.resize(image, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    return image
+
+
+class IngestedImage:
+    """
+    一张上传图片的解码结果。
+    detect_image 是供检测器使用的低分辨率图像 (已应用EXIF方向)；
+    ocr_image 在第一次访问时才从原始字节中以较高分辨率解码。
+    detect_image 上的坐标乘以 ocr_scale 即可映射到 ocr_image 上。
+    """
+
+    def __init__(self, detect_image, data=None, header=None, full_image=None):
+        self.detect_image = detect_image
+        self._data = data
+        self._header = header
+        self._ocr_image = full_image
+        self._digest = None
+
+    @classmethod
+    def from_bytes(cls, data):
+        header = _read_header(data)
+        return cls(_decode(data, INGEST_DETECT_LONG_SIDE, header), data=data, header=header)
+
+    @classmethod
+    def from_array(cls, image):
+        """已经解码好的图片: 检测与OCR共用同一张图"""
+        return cls(image, full_image=image)
+
+    @property
+    def ocr_image(self):
+        if self._ocr_image is None:
+            if max(self.detect_image.shape[:2]) >= INGEST_OCR_LONG_SIDE:
+                self._ocr_image = self.detect_image
+            else:
+                self._ocr_image = _decode(self._data, INGEST_OCR_LONG_SIDE, self._header)
+        return self._ocr_image
+
+    @property
+    def digest(self):
+        """图片内容的 SHA-256: 上传的原始字节，或 (没有原始字节时) 解码后的像素"""
+        if self._digest is None:
+            if self._data is not None:
+                self._digest = hashlib.sha256(self._data).hexdigest()
+            else:
+                image = self._ocr_image
+                hasher = hashlib.sha256(repr(image.shape).encode('ascii'))
+                hasher.update(np.ascontiguousarray(image).data)
+                self._digest = hasher.hexdigest()
+        return self._digest
+
+    @property
+    def ocr_scale(self):
+        return self.ocr_image.shape[1] / float(self.detect_image.shape[1])
+
+    def __getstate__(self):
+        # 传给工作进程时不携带尚未用到的高分辨率解码结果，由子进程按需重新解码
+        state = self.__dict__.copy()
+        if self._data is not None:
+            state['_ocr_image'] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+
+
+def ingest_image(data):
+    """校验并解码上传的图片字节；无法识别的图片抛出 ValueError"""
+    try:
+        return IngestedImage.from_bytes(data)
+    except (OSError, SyntaxError, Image.DecompressionBombError) as e:
+        raise ValueError(f"无法解析图片: {e}")
@@ -0,0 +1,97 @@
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+
+class JobStoreFull(Exception):
+    """未完成的异步任务过多"""
+
+
+class RecognitionJob:
+    __slots__ = ('job_id', 'status', 'result', 'status_code', 'created_at', 'finished_at', 'done_event')
+
+    def __init__(self, job_id):
+        self.job_id = job_id
+        self.status = "pending"
+        self.result = None
+        self.status_code = None
+        self.created_at = time.time()
+        self.finished_at = None
+        self.done_event = threading.Event()
+
+    def to_dict(self):
+        data = {"job_id": self.job_id, "status": self.status, "created_at": self.created_at}
+        if self.status == "done":
+            data.update({
+                "status_code": self.status_code,
+                "result": self.result,
+                "finished_at": self.finished_at,
+            })
+        return data
+
+
+class RecognitionJobStore:
+    """
+    **异步识别改造**: 异步识别任务的执行与结果保存。
+    任务在独立的线程池中执行，HTTP请求提交后立即返回任务ID；
+    已完成的结果保留 result_ttl 秒，之后自动清理。未完成的任务数超过 max_pending 时拒绝新任务。
+    """
+
+    def __init__(self, runner, workers=4, max_pending=64, result_ttl=300):
+        self.runner = runner
+        self.max_pending = max_pending
+        self.result_ttl = result_ttl
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="recognize-job")
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._stats = {"submitted": 0, "completed": 0, "rejected": 0, "expired": 0}
+
+    def _purge_expired(self, now):
+        expired = [job_id for job_id, job in self._jobs.items()
+                   if job.finished_at is not None and now - job.finished_at > self.result_ttl]
+        for job_id in expired:
+            del self._jobs[job_id]
+        self._stats["expired"] += len(expired)
+
+    def submit(self, *args):
+        """创建任务并交给线程池执行，返回任务对象；未完成任务过多时抛出 JobStoreFull"""
+        with self._lock:
+            self._purge_expired(time.time())
+            if self._pending >= self.max_pending:
+                self._stats["rejected"] += 1
+                raise JobStoreFull()
+            job = RecognitionJob(uuid.uuid4().hex)
+            self._jobs[job.job_id] = job
+            self._pending += 1
+            self._stats["submitted"] += 1
+        self._executor.submit(self._run, job, args)
+        return job
+
+    def _run(self, job, args):
+        job.status = "running"
+        try:
+            result, status_code = self.runner(*args)
+        except Exception as e:
+            result, status_code = {"error": "An unexpected error occurred", "details": str(e)}, 500
+        with self._lock:
+            job.result = result
+            job.status_code = status_code
+            job.finished_at = time.time()
+            job.status = "done"
+            self._pending -= 1
+            self._stats["completed"] += 1
+        job.done_event.set()
+
+    def get(self, job_id):
+        with self._lock:
+            self._purge_expired(time.time())
+            return self._jobs.get(job_id)
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats.update({"pending": self._pending, "stored": len(self._jobs),
+                          "max_pending": self.max_pending, "result_ttl": self.result_ttl})
+        return stats
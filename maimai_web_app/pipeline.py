@@ -0,0 +1,139 @@
+import queue
+import threading
+import time
+import traceback
+from concurrent.futures import Future
+
+
+class PipelineFull(Exception):
+    """流水线入口队列已满"""
+
+
+class _PipelineJob:
+    __slots__ = ('ctx', 'future', 'enqueued_at')
+
+    def __init__(self, ctx):
+        self.ctx = ctx
+        self.future = Future()
+        self.enqueued_at = time.perf_counter()
+
+
+class PipelineStage:
+    """流水线中的一个阶段: 一个有界输入队列 + 一组专属工作线程"""
+
+    def __init__(self, name, handler, workers=1, queue_size=16):
+        self.name = name
+        self.handler = handler
+        self.workers = max(1, int(workers))
+        self.queue = queue.Queue(maxsize=max(1, int(queue_size)))
+        self._stats_lock = threading.Lock()
+        self._busy = 0
+        self._processed = 0
+        self._errors = 0
+        self._busy_seconds = 0.0
+        self._wait_seconds = 0.0
+        self._max_depth = 0
+
+    def record(self, busy_seconds, wait_seconds, failed):
+        with self._stats_lock:
+            self._processed += 1
+            self._busy_seconds += busy_seconds
+            self._wait_seconds += wait_seconds
+            if failed:
+                self._errors += 1
+
+    def mark_busy(self, delta):
+        with self._stats_lock:
+            self._busy += delta
+
+    def note_depth(self):
+        depth = self.queue.qsize()
+        with self._stats_lock:
+            if depth > self._max_depth:
+                self._max_depth = depth
+
+    def get_stats(self, uptime_seconds):
+        with self._stats_lock:
+            processed = self._processed
+            stats = {
+                "workers": self.workers,
+                "queue_depth": self.queue.qsize(),
+                "queue_capacity": self.queue.maxsize,
+                "max_queue_depth": self._max_depth,
+                "busy_workers": self._busy,
+                "processed": processed,
+                "errors": self._errors,
+                "avg_service_ms": round(self._busy_seconds / processed * 1000.0, 3) if processed else 0.0,
+                "avg_queue_wait_ms": round(self._wait_seconds / processed * 1000.0, 3) if processed else 0.0,
+                # 启动以来该阶段线程处于忙碌状态的时间占比，接近1说明该阶段是瓶颈，需要加线程
+                "utilization": round(self._busy_seconds / (self.workers * uptime_seconds), 4) if uptime_seconds > 0 else 0.0,
+            }
+        return stats
+
+
+class StagedPipeline:
+    """
+    **流水线改造**: 多阶段识别流水线。
+    每个阶段有自己的有界队列与线程池，任务按阶段顺序流转，
+    因此请求N在做OCR时，请求N+1可以同时在做检测。
+    阶段处理函数接收上下文字典；当它设置了 ctx["error"] 时，任务直接结束，不再进入后续阶段。
+    入口队列满时 submit() 抛出 PipelineFull，内部阶段之间则通过阻塞的 put() 形成反压。
+    """
+
+    def __init__(self, stages):
+        self.stages = list(stages)
+        self._started_at = time.perf_counter()
+        for index, stage in enumerate(self.stages):
+            for worker_index in range(stage.workers):
+                thread = threading.Thread(
+                    target=self._worker_loop,
+                    args=(index,),
+                    name=f"pipeline-{stage.name}-{worker_index}",
+                )
+                thread.daemon = True
+                thread.start()
+
+    def submit(self, ctx):
+        """提交一个任务，返回 concurrent.futures.Future，完成后其结果为上下文字典"""
+        job = _PipelineJob(ctx)
+        first_stage = self.stages[0]
+        try:
+            first_stage.queue.put_nowait(job)
+        except queue.Full:
+            raise PipelineFull(f"Pipeline stage '{first_stage.name}' is full")
+        first_stage.note_depth()
+        return job.future
+
+    def _worker_loop(self, index):
+        stage = self.stages[index]
+        while True:
+            job = stage.queue.get()
+            started_at = time.perf_counter()
+            wait_seconds = started_at - job.enqueued_at
+            stage.mark_busy(1)
+            failed = False
+            try:
+                stage.handler(job.ctx)
+            except BaseException as e:
+                failed = True
+                print(f"流水线阶段 '{stage.name}' 处理失败: {e}")
+                traceback.print_exc()
+                job.future.set_exception(e)
+            finally:
+                stage.mark_busy(-1)
+                stage.record(time.perf_counter() - started_at, wait_seconds, failed)
+            if failed:
+                continue
+
+            next_index = index + 1
+            if job.ctx.get("error") or next_index >= len(self.stages):
+                job.future.set_result(job.ctx)
+                continue
+            next_stage = self.stages[next_index]
+            job.enqueued_at = time.perf_counter()
+            next_stage.queue.put(job)
+            next_stage.note_depth()
+
+    def get_stats(self):
+        uptime = time.perf_counter() - self._started_at
+        return {stage.name: stage.get_stats(uptime) for stage in self.stages}
@@ -0,0 +1,165 @@
+import math
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+import recognizer
+
+
+class RecognitionQueueFull(Exception):
+    """识别任务队列已满，调用方应返回 503 并附带 Retry-After"""
+
+    def __init__(self, retry_after):
+        super().__init__("Recognition queue is full")
+        self.retry_after = retry_after
+
+
+class RecognitionTimeout(Exception):
+    """识别任务在规定时间内没有完成 (例如工作进程崩溃)"""
+
+
+def _init_worker(torch_threads):
+    """工作进程初始化: 限制每个进程的推理线程数，并确保模型已就绪"""
+    try:
+        import torch
+        torch.set_num_threads(torch_threads)
+    except Exception as e:
+        print(f"[pid {os.getpid()}] 设置torch线程数失败: {e}")
+    # fork模式下模型已由父进程预加载 (写时复制)，这里不会重复加载
+    recognizer.load_models()
+
+
+def _warm_up():
+    return os.getpid()
+
+
+def _run_job(source, unique_id):
+    """在工作进程中执行 YOLO + OCR，返回 (ocr_text, error, cascade)"""
+    return recognizer.detect_and_read_title(source, unique_id)
+
+
+class RecognitionWorkerPool:
+    """
+    **多进程改造**: 识别工作进程池。
+    每个进程持有独立的 YOLO 与 PaddleOCR 实例；支持fork的平台上由父进程先加载模型，
+    子进程通过写时复制共享权重内存。等待中的任务数超过 max_pending 时直接拒绝，
+    由上层返回 503，而不是让请求在线程池里无限堆积。
+    工作进程异常退出 (段错误、被OOM杀死) 时，ProcessPoolExecutor 会让所有未完成的任务以
+    BrokenProcessPool 结束，名额随之归还，随后整个进程池被重建。
+    """
+
+    def __init__(self, workers, max_pending, job_timeout=60, torch_threads=1, preload=True):
+        self.workers = max(1, int(workers))
+        self.max_pending = max(self.workers, int(max_pending))
+        self.job_timeout = job_timeout
+        start_methods = multiprocessing.get_all_start_methods()
+        self.start_method = 'fork' if 'fork' in start_methods else 'spawn'
+        if self.start_method == 'fork' and preload:
+            recognizer.load_models()
+        self._ctx = multiprocessing.get_context(self.start_method)
+        self._torch_threads = torch_threads
+        self._executor_lock = threading.Lock()
+        self._executor = self._new_executor()
+        # 启动时提交一个空任务: 进程池在第一次提交时才创建进程，确保fork发生在waitress线程启动之前
+        self._executor.submit(_warm_up).result()
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+        self._stats_lock = threading.Lock()
+        self._pending = 0
+        self._stats = {"submitted": 0, "completed": 0, "rejected": 0, "timeouts": 0, "crashes": 0,
+                       "pool_restarts": 0, "job_total_ms": 0.0}
+        print(f"识别工作进程池已启动: {self.workers} 个进程 ({self.start_method})，队列上限 {self.max_pending}。")
+
+    def _new_executor(self):
+        return ProcessPoolExecutor(max_workers=self.workers, mp_context=self._ctx,
+                                   initializer=_init_worker, initargs=(self._torch_threads,))
+
+    def _restart(self, broken_executor):
+        """替换已损坏的进程池；多个请求同时发现损坏时只重建一次"""
+        with self._executor_lock:
+            if self._executor is not broken_executor:
+                return
+            self._executor = self._new_executor()
+        with self._stats_lock:
+            self._stats["pool_restarts"] += 1
+        broken_executor.shutdown(wait=False)
+        print("识别工作进程异常退出，进程池已重建。")
+
+    def _submit(self, source, unique_id):
+        """提交任务，返回 (进程池, future)；进程池已损坏时重建后重试一次"""
+        with self._executor_lock:
+            executor = self._executor
+        try:
+            return executor, executor.submit(_run_job, source, unique_id)
+        except BrokenProcessPool:
+            self._restart(executor)
+            with self._executor_lock:
+                executor = self._executor
+            return executor, executor.submit(_run_job, source, unique_id)
+
+    def _estimate_retry_after(self):
+        """根据平均耗时与当前排队数粗略估算客户端应等待的秒数"""
+        with self._stats_lock:
+            completed = self._stats["completed"]
+            avg_seconds = (self._stats["job_total_ms"] / completed / 1000.0) if completed else 2.0
+            pending = self._pending
+        return max(1, math.ceil(avg_seconds * pending / self.workers))
+
+    def run(self, source, unique_id):
+        """提交任务并等待结果，返回 (ocr_text, error, cascade)；队列已满时抛出 RecognitionQueueFull"""
+        if not self._slots.acquire(blocking=False):
+            with self._stats_lock:
+                self._stats["rejected"] += 1
+            raise RecognitionQueueFull(self._estimate_retry_after())
+
+        started_at = time.perf_counter()
+        with self._stats_lock:
+            self._pending += 1
+            self._stats["submitted"] += 1
+
+        def on_done(_future):
+            # 任务真正结束 (成功、异常或工作进程退出导致的 BrokenProcessPool) 后才归还名额，
+            # 请求线程超时返回时工作进程仍在运行，此时提前归还会让同时执行的任务数超过 max_pending
+            with self._stats_lock:
+                self._pending -= 1
+                self._stats["completed"] += 1
+                self._stats["job_total_ms"] += (time.perf_counter() - started_at) * 1000.0
+            self._slots.release()
+
+        try:
+            executor, future = self._submit(source, unique_id)
+        except BaseException:
+            with self._stats_lock:
+                self._pending -= 1
+            self._slots.release()
+            raise
+        future.add_done_callback(on_done)
+        try:
+            return future.result(timeout=self.job_timeout)
+        except FutureTimeoutError:
+            with self._stats_lock:
+                self._stats["timeouts"] += 1
+            raise RecognitionTimeout(f"识别任务 {unique_id} 超过 {self.job_timeout} 秒未完成")
+        except BrokenProcessPool:
+            with self._stats_lock:
+                self._stats["crashes"] += 1
+            self._restart(executor)
+            raise RecognitionTimeout(f"识别任务 {unique_id} 执行时工作进程异常退出")
+
+    def get_stats(self):
+        with self._stats_lock:
+            stats = dict(self._stats)
+            pending = self._pending
+        completed = stats.pop("completed")
+        job_total_ms = stats.pop("job_total_ms")
+        stats.update({
+            "workers": self.workers,
+            "start_method": self.start_method,
+            "max_pending": self.max_pending,
+            "pending": pending,
+            "completed": completed,
+            "avg_job_ms": round(job_total_ms / completed, 3) if completed else 0.0,
+        })
+        return stats
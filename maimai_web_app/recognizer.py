@@ -0,0 +1,520 @@
+import os
+import math
+import threading
+import traceback
+
+import cv2
+
+from ingest import IngestedImage
+
+# --- 识别模块: YOLO + OCR 部分 ---
+# **多进程改造**: 该模块不依赖Flask，既可以在主进程中使用，
+# 也可以被识别工作进程导入，每个进程各自持有一份模型实例。
+
+APP_ROOT = os.path.dirname(os.path.abspath(__file__))
+MONITORING_FLAG_PATH = os.path.join(APP_ROOT, 'monitoring.flag')
+# **终极路径修复**: 改为相对路径
+YOLO_MODEL_PATH = os.path.join(APP_ROOT, '..', 'ultralytics-main', 'runs', 'detect', 'train11', 'weights', 'best.pt')
+
+# **推理后端改造**: 检测模型的CPU推理后端。
+# pytorch = 原始 best.pt；onnx = ONNX Runtime；openvino / openvino_int8 = OpenVINO (FP32 / INT8训练后量化)。
+# 导出文件由 scripts/export_detector.py 生成，与 best.pt 放在同一目录，ultralytics 会按后缀自动选择推理引擎。
+DETECTOR_BACKEND = os.getenv('DETECTOR_BACKEND', 'pytorch').lower()
+_WEIGHTS_DIR = os.path.dirname(YOLO_MODEL_PATH)
+DETECTOR_MODEL_PATHS = {
+    'pytorch': YOLO_MODEL_PATH,
+    'onnx': os.path.join(_WEIGHTS_DIR, 'best.onnx'),
+    'openvino': os.path.join(_WEIGHTS_DIR, 'best_openvino_model'),
+    'openvino_int8': os.path.join(_WEIGHTS_DIR, 'best_int8_openvino_model'),
+}
+
+NO_TITLE_ERROR = "未能识别到歌曲名，请尝试调整拍摄角度，确保画面清晰、无反光。"
+OCR_EMPTY_ERROR = "OCR did not recognize any text from the best crop."
+
+# **识别专用OCR改造**: OCR_MODE=full 使用完整的 PaddleOCR (文本检测+识别)；
+# OCR_MODE=rec_only 只加载 PP-OCRv5 识别模型，直接识别YOLO已定位好的标题裁剪图。
+OCR_MODE = os.getenv('OCR_MODE', 'full')
+# 裁剪图 高/宽 超过该比例时视为多行 (例如 name1/name2 类)，需要先切分文本行
+OCR_LINE_SPLIT_ASPECT = float(os.getenv('OCR_LINE_SPLIT_ASPECT', '0.3'))
+OCR_REC_BATCH_SIZE = 8
+
+# **级联检测改造**: 首轮粗检的推理尺寸、全分辨率尺寸，以及粗检结果可以直接采用的最低置信度
+CASCADE_COARSE_IMGSZ = int(os.getenv('CASCADE_COARSE_IMGSZ', '416'))
+CASCADE_FULL_IMGSZ = int(os.getenv('CASCADE_FULL_IMGSZ', '640'))
+CASCADE_MIN_CONF = float(os.getenv('CASCADE_MIN_CONF', '0.5'))
+CASCADE_MIN_RESCAN_IMGSZ = 160
+
+yolo_model = None
+ocr_instance = None
+# 实际生效的检测后端 (导出文件缺失时会回退为 pytorch)
+active_detector_backend = None
+
+
+def resolve_detector_path(backend=None):
+    """返回指定推理后端对应的模型路径；导出文件不存在时回退到 best.pt"""
+    backend = backend or DETECTOR_BACKEND
+    if backend not in DETECTOR_MODEL_PATHS:
+        print(f"未知的检测后端 '{backend}'，可选: {', '.join(DETECTOR_MODEL_PATHS)}。将使用 pytorch。")
+        return 'pytorch', YOLO_MODEL_PATH
+    path = DETECTOR_MODEL_PATHS[backend]
+    if backend != 'pytorch' and not os.path.exists(path):
+        print(f"检测后端 '{backend}' 的模型文件不存在: {path}，请先运行 scripts/export_detector.py。将使用 pytorch。")
+        return 'pytorch', YOLO_MODEL_PATH
+    return backend, path
+
+
+def load_detector(backend=None):
+    """按推理后端加载一个新的YOLO检测模型实例，返回 (实际使用的后端, 模型)"""
+    from ultralytics import YOLO
+    backend, path = resolve_detector_path(backend)
+    print(f"[pid {os.getpid()}] 正在加载YOLOv8模型 (后端: {backend})...")
+    model = YOLO(path, task='detect')
+    print(f"[pid {os.getpid()}] YOLOv8模型加载成功！")
+    return backend, model
+
+
+def load_models():
+    """加载YOLO与PaddleOCR模型 (每个进程只加载一次)，返回 (yolo_model, ocr_instance)"""
+    global yolo_model, ocr_instance, active_detector_backend
+    if yolo_model is None:
+        active_detector_backend, yolo_model = load_detector()
+    if ocr_instance is None and OCR_MODE == 'rec_only':
+        from paddleocr import TextRecognition
+        print(f"[pid {os.getpid()}] 正在加载PaddleOCR识别模型 (rec_only模式)...")
+        ocr_instance = TextRecognition(
+            model_name="PP-OCRv5_mobile_rec",
+            device="cpu",
+            enable_mkldnn=False,
+            cpu_threads=int(os.getenv('OCR_CPU_THREADS', '2')),
+        )
+        print(f"[pid {os.getpid()}] PaddleOCR识别模型加载成功！")
+    elif ocr_instance is None:
+        from paddleocr import PaddleOCR
+        print(f"[pid {os.getpid()}] 正在加载PaddleOCR模型...")
+        ocr_instance = PaddleOCR(
+            device="cpu",
+            enable_mkldnn=False,
+            cpu_threads=int(os.getenv('OCR_CPU_THREADS', '2')),
+            use_doc_orientation_classify=False,
+            use_doc_unwarping=False,
+            use_textline_orientation=False,
+            text_recognition_model_name="PP-OCRv5_mobile_rec",
+            text_detection_model_name="PP-OCRv5_mobile_det",
+        )
+        print(f"[pid {os.getpid()}] PaddleOCR模型加载成功！")
+    return yolo_model, ocr_instance
+
+
+def is_monitoring_enabled():
+    """检查监控模式是否开启（由后台管理面板创建/删除 monitoring.flag）"""
+    return os.path.exists(MONITORING_FLAG_PATH)
+
+
+def is_inside(inner_box, outer_box):
+    """检查 inner_box 是否在 outer_box 内部"""
+    ix1, iy1, ix2, iy2 = inner_box.xyxy[0]
+    ox1, oy1, ox2, oy2 = outer_box.xyxy[0]
+    return ix1 >= ox1 and iy1 >= oy1 and ix2 <= ox2 and iy2 <= oy2
+
+
+def get_most_centered_box(boxes, img_shape):
+    """从一组box中找到最居中的那一个"""
+    if not boxes:
+        return None
+
+    img_height, img_width = img_shape
+    img_center_x, img_center_y = img_width / 2, img_height / 2
+
+    min_distance = float('inf')
+    most_centered = None
+
+    for box in boxes:
+        x1, y1, x2, y2 = box.xyxy[0]
+        box_center_x = (x1 + x2) / 2
+        box_center_y = (y1 + y2) / 2
+        distance = math.sqrt((box_center_x - img_center_x)**2 + (box_center_y - img_center_y)**2)
+
+        if distance < min_distance:
+            min_distance = distance
+            most_centered = box
+
+    return most_centered
+
+
+def crop_box_from_image(box, image, scale=1.0):
+    """
+    直接从内存中的原图 (BGR ndarray) 按 box.xyxy 裁剪目标区域。
+    沿用YOLO save_crop 的扩边规则 (gain=1.02, pad=10)，保证OCR输入与之前落盘的裁剪图一致。
+    scale 用于把检测图上的坐标映射到更高分辨率的 image 上 (见 ingest.IngestedImage.ocr_scale)。
+    """
+    from ultralytics.utils.plotting import save_one_box
+    xyxy = box.xyxy * scale if scale != 1.0 else box.xyxy
+    return save_one_box(xyxy, image, BGR=True, save=False)
+
+
+def save_monitoring_artifacts(result, run_dir, pass_name):
+    """监控模式下，将YOLO的所有检测裁剪图写入 runs/detect/<id>/<pass_name>/crops 以便排查"""
+    try:
+        result.save_crop(save_dir=os.path.join(run_dir, pass_name, 'crops'))
+    except Exception as e:
+        print(f"保存监控裁剪图失败 ({pass_name}): {e}")
+
+
+def split_text_lines(crop_image, min_line_ratio=0.35, pad=4):
+    """
+    **识别专用OCR改造**: 用水平投影切分多行标题裁剪图，返回按从上到下排列的行图像列表。
+    切分失败 (找不到明显的行间空白) 时返回只包含原图的列表。
+    """
+    gray = cv2.cvtColor(crop_image, cv2.COLOR_BGR2GRAY) if crop_image.ndim == 3 else crop_image
+    _, binary = cv2.threshold(gray, 0, 1, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    # 文字像素应为少数，若前景占多数说明是浅色字，需要反转
+    if binary.mean() > 0.5:
+        binary = 1 - binary
+    row_ink = binary.mean(axis=1)
+    ink_rows = row_ink > max(0.02, row_ink.max() * 0.1)
+
+    bands = []
+    start = None
+    for y, has_ink in enumerate(ink_rows):
+        if has_ink and start is None:
+            start = y
+        elif not has_ink and start is not None:
+            bands.append([start, y])
+            start = None
+    if start is not None:
+        bands.append([start, len(ink_rows)])
+    if not bands:
+        return [crop_image]
+
+    # 合并间隔过小的行段 (同一行文字内部的笔画空隙)
+    max_height = max(end - begin for begin, end in bands)
+    merged = [bands[0]]
+    for begin, end in bands[1:]:
+        if begin - merged[-1][1] < max_height * 0.25:
+            merged[-1][1] = end
+        else:
+            merged.append([begin, end])
+
+    max_height = max(end - begin for begin, end in merged)
+    lines = []
+    for begin, end in merged:
+        if end - begin < max_height * min_line_ratio:
+            continue  # 过矮的行段多为噪点或分隔线
+        top = max(0, begin - pad)
+        bottom = min(crop_image.shape[0], end + pad)
+        lines.append(crop_image[top:bottom])
+    return lines if len(lines) > 1 else [crop_image]
+
+
+def read_title_text(crop_image, unique_id):
+    """对标题裁剪图执行OCR，返回去掉'等级'字样后的拼接文本"""
+    if OCR_MODE == 'rec_only':
+        lines = [crop_image]
+        if crop_image.shape[0] > crop_image.shape[1] * OCR_LINE_SPLIT_ASPECT:
+            lines = split_text_lines(crop_image)
+            print(f"[{unique_id}] Tall crop split into {len(lines)} line(s) for recognition.")
+        # 所有行合并为一次识别调用
+        rec_results = ocr_instance.predict(lines, batch_size=OCR_REC_BATCH_SIZE)
+        texts = [res.get('rec_text', '') for res in rec_results if res is not None]
+    else:
+        ocr_result = ocr_instance.predict(crop_image)
+        texts = ocr_result[0].get('rec_texts', []) if ocr_result and ocr_result[0] is not None else []
+    filtered_texts = [text for text in texts if text and '等级' not in text]
+    return "".join(filtered_texts)
+
+
+def group_boxes_by_class(boxes):
+    """按类别ID对检测框分组"""
+    all_boxes = {int(b.cls): [] for b in boxes}
+    for b in boxes:
+        all_boxes[int(b.cls)].append(b)
+    return all_boxes
+
+
+def select_primary_target(all_boxes, img_shape):
+    """第一次筛选逻辑: 优先 name，其次 frame1 内的 name1，再其次 frame2 内的 name2"""
+    name_boxes = all_boxes.get(0, [])
+    name1_boxes = all_boxes.get(1, [])
+    frame1_boxes = all_boxes.get(2, [])
+    name2_boxes = all_boxes.get(3, [])
+    frame2_boxes = all_boxes.get(4, [])
+
+    if name_boxes:
+        return get_most_centered_box(name_boxes, img_shape)
+    elif frame1_boxes:
+        name1_in_frame1 = [n1 for n1 in name1_boxes for f1 in frame1_boxes if is_inside(n1, f1)]
+        if name1_in_frame1:
+            return get_most_centered_box(name1_in_frame1, img_shape)
+    elif frame2_boxes:
+        name2_in_frame2 = [n2 for n2 in name2_boxes for f2 in frame2_boxes if is_inside(n2, f2)]
+        if name2_in_frame2:
+            return get_most_centered_box(name2_in_frame2, img_shape)
+    return None
+
+
+def rescan_imgsz_for(crop_image):
+    """二次扫描的推理尺寸与裁剪图大小匹配 (32的倍数)，避免把小图放大到全分辨率推理"""
+    longest_side = max(crop_image.shape[:2])
+    size = int(math.ceil(longest_side / 32.0) * 32)
+    return max(CASCADE_MIN_RESCAN_IMGSZ, min(CASCADE_FULL_IMGSZ, size))
+
+
+class CascadeStats:
+    """
+    **级联检测改造**: 统计每一级检测的命中情况，用于调节阈值。
+    各级含义: coarse=低分辨率首轮直接命中，fine=升级到全分辨率后命中，
+    rescan=frame区域二次扫描命中，fallback=最终降级策略命中，miss=未找到标题。
+    """
+    TIERS = ("coarse", "fine", "rescan", "fallback", "miss")
+
+    def __init__(self, log_every=50):
+        self.log_every = log_every
+        self._lock = threading.Lock()
+        self._counts = {tier: 0 for tier in self.TIERS}
+        self._escalations = 0
+
+    def record(self, cascade):
+        with self._lock:
+            tier = cascade["tier"]
+            self._counts[tier] = self._counts.get(tier, 0) + 1
+            if cascade["escalated"]:
+                self._escalations += 1
+            total = sum(self._counts.values())
+            should_log = self.log_every and total % self.log_every == 0
+        if should_log:
+            print(f"[Cascade] {self.get_stats()}")
+
+    def get_stats(self):
+        with self._lock:
+            counts = dict(self._counts)
+            escalations = self._escalations
+        total = sum(counts.values())
+        return {
+            "coarse_imgsz": CASCADE_COARSE_IMGSZ,
+            "full_imgsz": CASCADE_FULL_IMGSZ,
+            "min_conf": CASCADE_MIN_CONF,
+            "total": total,
+            "counts": counts,
+            "hit_rates": {tier: round(count / total, 4) if total else 0.0 for tier, count in counts.items()},
+            "escalation_rate": round(escalations / total, 4) if total else 0.0,
+        }
+
+
+# --- **流水线改造**: 识别流程拆分为独立的阶段函数 ---
+# 每个阶段读写同一个上下文字典；阶段设置 ctx["error"] 后，后续阶段不再执行。
+# detect_and_read_title 顺序执行这些阶段 (工作进程使用)，
+# 主进程的 StagedPipeline 则为每个阶段配置独立的线程池，让不同请求的阶段互相重叠。
+
+def new_context(source, unique_id):
+    return {
+        "unique_id": unique_id,
+        "source": source,
+        "image": None,
+        "ingest": None,
+        "monitoring": is_monitoring_enabled(),
+        "run_dir": os.path.join('runs', 'detect', unique_id),
+        "cascade": {"tier": "miss", "escalated": False},
+        "error": None,
+        "ocr_text": None,
+    }
+
+
+def stage_decode(ctx):
+    """
+    解码阶段: 把文件路径、图片字节或BGR ndarray 统一为 IngestedImage。
+    **快速解码改造**: 字节输入只按检测分辨率解码 (JPEG DCT缩放 + EXIF方向)，
+    ctx["image"] 为检测用的小图，高分辨率图像仅在裁剪标题时按需解码。
+    """
+    source = ctx["source"]
+    try:
+        if isinstance(source, IngestedImage):
+            ingested = source
+        elif isinstance(source, str):
+            with open(source, 'rb') as f:
+                ingested = IngestedImage.from_bytes(f.read())
+        elif isinstance(source, (bytes, bytearray, memoryview)):
+            ingested = IngestedImage.from_bytes(bytes(source))
+        else:
+            ingested = IngestedImage.from_array(source) if source is not None else None
+    except (OSError, SyntaxError, ValueError) as e:
+        print(f"[{ctx['unique_id']}] Failed to decode image: {e}")
+        ingested = None
+    if ingested is None:
+        ctx["error"] = ({"error": "无法解析上传的图片，请确认文件为有效的图片格式"}, 400)
+        return
+    ctx["ingest"] = ingested
+    ctx["image"] = ingested.detect_image
+
+
+def stage_detect(ctx, predict):
+    """
+    检测阶段: 执行所有YOLO推理。
+    **级联检测改造**: 首轮使用较小的 imgsz，置信度不足时才升级到全分辨率；
+    首轮筛选不到标题时，只在内存中的frame区域上二次扫描，推理尺寸与裁剪图匹配。
+    """
+    unique_id = ctx["unique_id"]
+    image = ctx["image"]
+    cascade = ctx["cascade"]
+
+    # 1. 第一次YOLO预测 (低分辨率粗检)
+    print(f"[{unique_id}] Running 1st YOLO prediction (imgsz={CASCADE_COARSE_IMGSZ})...")
+    yolo_result = predict(image, imgsz=CASCADE_COARSE_IMGSZ, device='cpu', verbose=False)
+    all_boxes = group_boxes_by_class(yolo_result.boxes) if yolo_result.boxes else {}
+    img_shape = yolo_result.orig_shape
+    target_box = select_primary_target(all_boxes, img_shape)
+    cascade["tier"] = "coarse"
+
+    # 1b. 粗检未命中或置信度不足时，升级到全分辨率
+    if CASCADE_COARSE_IMGSZ < CASCADE_FULL_IMGSZ and (target_box is None or float(target_box.conf) < CASCADE_MIN_CONF):
+        coarse_conf = f"{float(target_box.conf):.2f}" if target_box is not None else "n/a"
+        print(f"[{unique_id}] Coarse pass confidence too low ({coarse_conf}). Escalating to imgsz={CASCADE_FULL_IMGSZ}...")
+        cascade["escalated"] = True
+        fine_result = predict(image, imgsz=CASCADE_FULL_IMGSZ, device='cpu', verbose=False)
+        fine_boxes = group_boxes_by_class(fine_result.boxes) if fine_result.boxes else {}
+        fine_target = select_primary_target(fine_boxes, img_shape)
+        # 全分辨率找到了目标才采用；否则保留粗检结果 (粗检的低置信度目标或更多的框仍可用于后续步骤)
+        if fine_target is not None or (target_box is None and len(fine_result.boxes or []) > len(yolo_result.boxes or [])):
+            yolo_result, all_boxes, target_box = fine_result, fine_boxes, fine_target
+            cascade["tier"] = "fine"
+        else:
+            print(f"[{unique_id}] Full-resolution pass found no better target. Keeping coarse result.")
+    if ctx["monitoring"]:
+        save_monitoring_artifacts(yolo_result, ctx["run_dir"], "predict_pass_1")
+
+    if not yolo_result.boxes:
+        cascade["tier"] = "miss"
+        ctx["error"] = ({"error": "YOLO did not detect any objects in the first pass."}, 500)
+        return
+
+    ctx["yolo_result"] = yolo_result
+    ctx["all_boxes"] = all_boxes
+    ctx["img_shape"] = img_shape
+    ctx["primary_target"] = target_box
+    ctx["rescan_result"] = None
+
+    # 2. **二次预测逻辑**
+    frame1_boxes = all_boxes.get(2, [])
+    frame2_boxes = all_boxes.get(4, [])
+    if not target_box and (frame1_boxes or frame2_boxes):
+        print(f"[{unique_id}] No direct name found. Initiating 2nd pass (Re-scan)...")
+
+        frame_to_rescan_boxes = frame1_boxes if frame1_boxes else frame2_boxes
+        frame_label = "frame1" if frame1_boxes else "frame2"
+        most_centered_frame = get_most_centered_box(frame_to_rescan_boxes, img_shape)
+
+        if most_centered_frame:
+            # **内存流水线改造**: 直接在内存中裁出frame区域进行二次预测，不再经过磁盘
+            # **快速解码改造**: frame区域从高分辨率图像中裁剪，小字标题在二次扫描中仍然清晰
+            ingested = ctx["ingest"]
+            frame_crop = crop_box_from_image(most_centered_frame, ingested.ocr_image, ingested.ocr_scale)
+            rescan_imgsz = rescan_imgsz_for(frame_crop)
+            print(f"[{unique_id}] Re-scanning in-memory '{frame_label}' crop ({frame_crop.shape[1]}x{frame_crop.shape[0]}, imgsz={rescan_imgsz})")
+            yolo_result_2 = predict(frame_crop, imgsz=rescan_imgsz, device='cpu', verbose=False)
+            if ctx["monitoring"]:
+                save_monitoring_artifacts(yolo_result_2, ctx["run_dir"], "predict_pass_2")
+            ctx["rescan_result"] = yolo_result_2
+
+
+def stage_select(ctx):
+    """选框阶段: 在首轮结果、二次扫描结果与降级策略之间确定最终目标，并在内存中裁剪"""
+    unique_id = ctx["unique_id"]
+    cascade = ctx["cascade"]
+    all_boxes = ctx["all_boxes"]
+    img_shape = ctx["img_shape"]
+    target_box = ctx["primary_target"]
+    # 最终裁剪所使用的源图与坐标缩放比例: 默认从高分辨率图像中裁剪，
+    # 二次预测成功时切换为二次预测的输入图 (本身已是高分辨率裁剪，无需缩放)
+    ingested = ctx["ingest"]
+    target_image = ingested.ocr_image
+    target_scale = ingested.ocr_scale
+
+    yolo_result_2 = ctx["rescan_result"]
+    if not target_box and yolo_result_2 is not None:
+        if yolo_result_2.boxes:
+            all_boxes_2 = group_boxes_by_class(yolo_result_2.boxes)
+            potential_targets_2 = all_boxes_2.get(0, []) + all_boxes_2.get(1, []) + all_boxes_2.get(3, [])
+            if potential_targets_2:
+                print(f"[{unique_id}] Success! Found name in 2nd pass.")
+                target_box = get_most_centered_box(potential_targets_2, yolo_result_2.orig_shape)
+                target_image = yolo_result_2.orig_img
+                target_scale = 1.0
+                cascade["tier"] = "rescan"
+        if not target_box:
+            print(f"[{unique_id}] 2nd pass failed to find any name.")
+
+    # 3. 如果二次预测后仍然没有目标，则执行最终降级策略
+    if not target_box:
+        print(f"[{unique_id}] 2nd pass failed or was not triggered. Applying final fallbacks.")
+        final_fallback_targets = all_boxes.get(0, []) + all_boxes.get(1, []) + all_boxes.get(3, [])
+        if final_fallback_targets:
+            target_box = get_most_centered_box(final_fallback_targets, img_shape)
+            cascade["tier"] = "fallback"
+
+    # 4. 如果最终还是没有找到，则报错
+    if not target_box:
+        cascade["tier"] = "miss"
+        ctx["error"] = ({"error": NO_TITLE_ERROR}, 500)
+        return
+
+    # 5. 处理最终的目标裁剪图 (内存切片)
+    target_label = yolo_model.names[int(target_box.cls)]
+    print(f"[{unique_id}] Final target selected: a '{target_label}' box (tier={cascade['tier']}).")
+    crop_image = crop_box_from_image(target_box, target_image, target_scale)
+
+    if crop_image is None or crop_image.size == 0:
+        ctx["error"] = ({"error": f"YOLO did not generate any crops for the final target '{target_label}'."}, 500)
+        return
+
+    if ctx["monitoring"]:
+        os.makedirs(ctx["run_dir"], exist_ok=True)
+        cv2.imwrite(os.path.join(ctx["run_dir"], f"final_{target_label}.jpg"), crop_image)
+    ctx["crop_image"] = crop_image
+
+
+def stage_ocr(ctx):
+    """OCR阶段: 识别裁剪图中的标题文本"""
+    unique_id = ctx["unique_id"]
+    crop_image = ctx["crop_image"]
+    print(f"[{unique_id}] Processing final crop in memory ({crop_image.shape[1]}x{crop_image.shape[0]})")
+    ocr_text = ""
+    try:
+        ocr_text = read_title_text(crop_image, unique_id)
+        print(f"[{unique_id}] OCR Result ({OCR_MODE}): {ocr_text}")
+    except BaseException:
+        print(f"--- [{unique_id}] OCR FAILED WITH UNKNOWN EXCEPTION ---")
+        traceback.print_exc()
+        ocr_text = ""
+
+    if not ocr_text:
+        ctx["error"] = ({"error": OCR_EMPTY_ERROR}, 404)
+        return
+    ctx["ocr_text"] = ocr_text
+
+
+def finish_context(ctx):
+    if ctx["monitoring"]:
+        print(f"[{ctx['unique_id']}] Monitoring mode is ON. Artifacts are preserved in {ctx['run_dir']}.")
+
+
+def detect_and_read_title(source, unique_id, predict=None):
+    """
+    对一张图片 (文件路径、图片字节或BGR格式的ndarray) 顺序执行 解码 -> 检测 -> 选框 -> OCR，
+    返回 (ocr_text, None, cascade)；失败时返回 (None, (错误字典, 状态码), cascade)。
+    cascade 记录命中的检测级别与是否升级过分辨率 (见 CascadeStats)。
+    predict 为 YOLO 推理函数，默认直接调用本进程的 yolo_model.predict。
+    **内存流水线改造**: 裁剪图直接从YOLO返回的 orig_img 中切片并交给OCR，
+    只有在监控模式开启时才会把中间产物写入 runs/detect/<id>。
+    """
+    model, _ = load_models()
+    if predict is None:
+        predict = lambda image, **kwargs: model.predict(source=image, **kwargs)[0]
+    ctx = new_context(source, unique_id)
+    stages = (stage_decode, lambda c: stage_detect(c, predict), stage_select, stage_ocr)
+    try:
+        for stage in stages:
+            stage(ctx)
+            if ctx["error"]:
+                break
+        return ctx["ocr_text"], ctx["error"], ctx["cascade"]
+    finally:
+        finish_context(ctx)
@@ -0,0 +1,84 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+
+
+class _CacheEntry:
+    __slots__ = ('result', 'status_code', 'expires_at', 'size')
+
+    def __init__(self, result, status_code, expires_at, size):
+        self.result = result
+        self.status_code = status_code
+        self.expires_at = expires_at
+        self.size = size
+
+
+class RecognitionResultCache:
+    """
+    **识别缓存改造**: 以上传内容摘要 (SHA-256，见 IngestedImage.digest) 为键的 LRU + TTL 识别结果缓存。
+    只有字节完全相同的图片 (重复上传、前端重试) 才会命中: 不同歌曲的结算截图版面一致，
+    只有标题文字不同，整图的感知哈希无法区分它们，因此不再按图像相似度查找。
+    缓存总大小按结果JSON的字节数估算，超过 max_bytes 或 max_entries 时按LRU淘汰。
+    """
+
+    def __init__(self, ttl=600, max_entries=2048, max_bytes=32 * 1024 * 1024):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._total_bytes = 0
+        self._stats = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0, "expired": 0}
+
+    def _remove(self, key):
+        entry = self._entries.pop(key)
+        self._total_bytes -= entry.size
+
+    def get(self, key):
+        """返回 (result, status_code)；未命中时返回 None"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.expires_at <= now:
+                self._remove(key)
+                self._stats["expired"] += 1
+                entry = None
+            if entry is None:
+                self._stats["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._stats["hits"] += 1
+            return entry.result, entry.status_code
+
+    def put(self, key, result, status_code):
+        if self.ttl <= 0:
+            return
+        size = len(json.dumps(result, ensure_ascii=False).encode('utf-8')) + 128
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = _CacheEntry(result, status_code, time.monotonic() + self.ttl, size)
+            self._total_bytes += size
+            self._stats["stores"] += 1
+            while self._entries and (len(self._entries) > self.max_entries or self._total_bytes > self.max_bytes):
+                oldest_key = next(iter(self._entries))
+                self._remove(oldest_key)
+                self._stats["evictions"] += 1
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            entries = len(self._entries)
+            total_bytes = self._total_bytes
+        lookups = stats["hits"] + stats["misses"]
+        stats.update({
+            "entries": entries,
+            "bytes": total_bytes,
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+            "hit_rate": round(stats["hits"] / lookups, 4) if lookups else 0.0,
+        })
+        return stats
@@ -0,0 +1,116 @@
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import time
+
+APP_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, APP_ROOT)
+
+from title_matcher import TitleMatcher
+
+# --- **向量化匹配改造**: 新旧标题匹配实现的延迟与准确率对比 ---
+# 旧实现: 每次调用重建标题列表并用 fuzzywuzzy.process.extract 逐个打分 (需要另行 pip install fuzzywuzzy)。
+# 新实现: TitleMatcher 预先规范化标题，用 rapidfuzz cdist 批量打分。
+# 查询由真实标题加上OCR/输入中常见的扰动 (删字、错字、全角、大小写) 生成，另外混入部分别名作为查询。
+
+SONGS_JSON_PATH = os.path.join(APP_ROOT, 'songs.json')
+ALIASES_JSON_PATH = os.path.join(APP_ROOT, 'aliases.json')
+THRESHOLD = 60
+
+
+def to_fullwidth(text):
+    return ''.join(chr(ord(ch) + 0xFEE0) if '!' <= ch <= '~' else ch for ch in text)
+
+
+def perturb(title, rng):
+    """模拟OCR与手工输入的误差"""
+    kind = rng.choice(('delete', 'replace', 'fullwidth', 'case', 'none'))
+    if len(title) > 3 and kind == 'delete':
+        i = rng.randrange(len(title))
+        return title[:i] + title[i + 1:]
+    if len(title) > 3 and kind == 'replace':
+        i = rng.randrange(len(title))
+        return title[:i] + rng.choice('ーー一口日曰0OlI1') + title[i + 1:]
+    if kind == 'fullwidth':
+        return to_fullwidth(title)
+    if kind == 'case':
+        return title.swapcase()
+    return title
+
+
+def build_queries(songs, aliases, count, rng):
+    titles = list(dict.fromkeys(song['title'] for song in songs))
+    queries = [(perturb(title, rng), title) for title in rng.sample(titles, min(count, len(titles)))]
+    alias_entries = [entry for entry in aliases if entry.get('Alias')]
+    for entry in rng.sample(alias_entries, min(count // 4, len(alias_entries))):
+        queries.append((rng.choice(entry['Alias']), entry['Name']))
+    return queries
+
+
+def old_top2(query, songs):
+    """原 find_best_match 的打分部分 (含每次调用的标题列表重建)"""
+    from fuzzywuzzy import process
+    unique_titles = list(set(song['title'] for song in songs))
+    return process.extract(query, unique_titles, limit=2)
+
+
+def summarize(name, latencies, results, queries):
+    correct = sum(1 for (query, expected), top in zip(queries, results)
+                  if top and top[0][1] > THRESHOLD and top[0][0] == expected)
+    p95 = sorted(latencies)[max(0, int(round(len(latencies) * 0.95)) - 1)]
+    print(f"{name:<22}{statistics.mean(latencies):>10.3f}{p95:>10.3f}{correct / len(queries):>10.1%}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="对比 fuzzywuzzy 与 TitleMatcher 的标题匹配性能")
+    parser.add_argument('--count', type=int, default=400, help="由标题生成的查询数量")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    with open(SONGS_JSON_PATH, 'r', encoding='utf-8') as f:
+        songs = json.load(f)
+    with open(ALIASES_JSON_PATH, 'r', encoding='utf-8') as f:
+        aliases = json.load(f).get('content', [])
+    queries = build_queries(songs, aliases, args.count, random.Random(args.seed))
+    print(f"共 {len(queries)} 个查询，{len(set(song['title'] for song in songs))} 个标题。")
+    print(f"{'implementation':<22}{'mean ms':>10}{'p95 ms':>10}{'top1 acc':>10}")
+
+    started_at = time.perf_counter()
+    matcher = TitleMatcher(dict.fromkeys(song['title'] for song in songs))
+    print(f"(TitleMatcher 构建耗时 {(time.perf_counter() - started_at) * 1000:.1f} ms)")
+
+    new_results, new_latencies = [], []
+    for query, _ in queries:
+        started_at = time.perf_counter()
+        new_results.append(matcher.top_k(query, k=2))
+        new_latencies.append((time.perf_counter() - started_at) * 1000.0)
+    summarize("TitleMatcher", new_latencies, new_results, queries)
+
+    started_at = time.perf_counter()
+    matcher.top_k_batch([query for query, _ in queries], k=2)
+    batch_ms = (time.perf_counter() - started_at) * 1000.0
+    print(f"{'TitleMatcher (batch)':<22}{batch_ms / len(queries):>10.3f}{'-':>10}{'-':>10}")
+
+    try:
+        import fuzzywuzzy  # noqa: F401
+    except ImportError:
+        print("未安装 fuzzywuzzy，跳过旧实现的对比。")
+        return
+    old_results, old_latencies = [], []
+    for query, _ in queries:
+        started_at = time.perf_counter()
+        old_results.append(old_top2(query, songs))
+        old_latencies.append((time.perf_counter() - started_at) * 1000.0)
+    summarize("fuzzywuzzy (old)", old_latencies, old_results, queries)
+
+    agree = sum(1 for old, new in zip(old_results, new_results)
+                if (old[0][0] if old and old[0][1] > THRESHOLD else None)
+                == (new[0][0] if new and new[0][1] > THRESHOLD else None))
+    print(f"两种实现的最终选择一致率: {agree / len(queries):.1%}")
+
+
+if __name__ == '__main__':
+    main()
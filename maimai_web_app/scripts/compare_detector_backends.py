@@ -0,0 +1,128 @@
+import argparse
+import os
+import statistics
+import sys
+import time
+
+APP_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, APP_ROOT)
+
+import recognizer
+from ingest import IngestedImage
+
+# --- **推理后端改造**: 各检测后端的精度/延迟对比 ---
+# 在一组未参与训练的截图上分别用各个后端推理，按线上的选框逻辑 (select_primary_target
+# + 最居中降级策略) 选出最终目标，与 pytorch 基准逐张比较类别与IoU，并统计推理延迟。
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp', '.bmp')
+# 与基准框的IoU不低于该值视为选中了同一个目标
+MATCH_IOU = 0.9
+
+
+def select_target(result):
+    """复现线上的选框规则 (不含frame二次扫描)，返回 (类别, xyxy) 或 None"""
+    if not result.boxes:
+        return None
+    all_boxes = recognizer.group_boxes_by_class(result.boxes)
+    target = recognizer.select_primary_target(all_boxes, result.orig_shape)
+    if target is None:
+        fallback = all_boxes.get(0, []) + all_boxes.get(1, []) + all_boxes.get(3, [])
+        target = recognizer.get_most_centered_box(fallback, result.orig_shape)
+    if target is None:
+        return None
+    return int(target.cls), [float(v) for v in target.xyxy[0]]
+
+
+def box_iou(a, b):
+    ix1, iy1 = max(a[0], b[0]), max(a[1], b[1])
+    ix2, iy2 = min(a[2], b[2]), min(a[3], b[3])
+    inter = max(0.0, ix2 - ix1) * max(0.0, iy2 - iy1)
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+    return inter / union if union > 0 else 0.0
+
+
+def load_images(image_dir):
+    images = []
+    for name in sorted(os.listdir(image_dir)):
+        if name.lower().endswith(IMAGE_EXTENSIONS):
+            with open(os.path.join(image_dir, name), 'rb') as f:
+                # 与线上一致: 按检测分辨率解码
+                images.append((name, IngestedImage.from_bytes(f.read()).detect_image))
+    return images
+
+
+def run_backend(model, images, imgsz, warmup):
+    for _, image in images[:warmup]:
+        model.predict(source=image, imgsz=imgsz, device='cpu', verbose=False)
+    selections, latencies = {}, []
+    for name, image in images:
+        started_at = time.perf_counter()
+        result = model.predict(source=image, imgsz=imgsz, device='cpu', verbose=False)[0]
+        latencies.append((time.perf_counter() - started_at) * 1000.0)
+        selections[name] = select_target(result)
+    return selections, latencies
+
+
+def compare(reference, selections):
+    """返回 (一致张数, 不一致的图片列表, 一致图片的平均IoU)"""
+    agreed, mismatches, ious = 0, [], []
+    for name, ref in reference.items():
+        got = selections.get(name)
+        if ref is None or got is None:
+            if ref is None and got is None:
+                agreed += 1
+            else:
+                mismatches.append((name, ref, got))
+            continue
+        iou = box_iou(ref[1], got[1])
+        if ref[0] == got[0] and iou >= MATCH_IOU:
+            agreed += 1
+            ious.append(iou)
+        else:
+            mismatches.append((name, ref, got))
+    return agreed, mismatches, (statistics.mean(ious) if ious else 0.0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="对比各检测后端的选框一致性与推理延迟")
+    parser.add_argument('image_dir', help="留出的测试截图目录")
+    parser.add_argument('--backends', nargs='+', default=list(recognizer.DETECTOR_MODEL_PATHS),
+                        choices=list(recognizer.DETECTOR_MODEL_PATHS))
+    parser.add_argument('--imgsz', nargs='+', type=int,
+                        default=[recognizer.CASCADE_COARSE_IMGSZ, recognizer.CASCADE_FULL_IMGSZ])
+    parser.add_argument('--warmup', type=int, default=3)
+    args = parser.parse_args()
+
+    images = load_images(args.image_dir)
+    if not images:
+        print(f"错误: {args.image_dir} 中没有图片")
+        sys.exit(1)
+    print(f"共 {len(images)} 张测试图片。")
+
+    backends = ['pytorch'] + [b for b in args.backends if b != 'pytorch']
+    models = {}
+    for backend in backends:
+        resolved, model = recognizer.load_detector(backend)
+        if resolved != backend:
+            print(f"跳过后端 '{backend}' (模型文件不存在)。")
+            continue
+        models[backend] = model
+
+    for imgsz in args.imgsz:
+        print(f"\n===== imgsz={imgsz} =====")
+        print(f"{'backend':<15}{'mean ms':>10}{'p95 ms':>10}{'agree':>10}{'mean IoU':>10}")
+        reference = None
+        for backend, model in models.items():
+            selections, latencies = run_backend(model, images, imgsz, args.warmup)
+            p95 = sorted(latencies)[max(0, int(round(len(latencies) * 0.95)) - 1)]
+            if reference is None:
+                reference = selections
+            agreed, mismatches, mean_iou = compare(reference, selections)
+            print(f"{backend:<15}{statistics.mean(latencies):>10.1f}{p95:>10.1f}"
+                  f"{agreed:>6}/{len(images):<3}{mean_iou:>10.3f}")
+            for name, ref, got in mismatches:
+                print(f"    不一致: {name}  pytorch={ref}  {backend}={got}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+import argparse
+import os
+import shutil
+import sys
+
+APP_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, APP_ROOT)
+
+import recognizer
+
+# --- **推理后端改造**: 将 best.pt 导出为 ONNX / OpenVINO (FP32、INT8) 模型 ---
+# 导出结果放在 best.pt 同目录下，通过 .env 中的 DETECTOR_BACKEND 选择使用哪一个。
+# 所有格式都以动态输入导出: 级联检测会用 416/640 以及与裁剪图匹配的尺寸推理，
+# 批处理调度器也会一次送入多张图片，固定形状的模型无法满足这两点。
+
+EXPORT_FORMATS = ('onnx', 'openvino', 'openvino_int8')
+
+
+def export_backend(backend, imgsz, data):
+    from ultralytics import YOLO
+    model = YOLO(recognizer.YOLO_MODEL_PATH)
+    if backend == 'onnx':
+        exported = model.export(format='onnx', imgsz=imgsz, dynamic=True, simplify=True)
+    elif backend == 'openvino':
+        exported = model.export(format='openvino', imgsz=imgsz, dynamic=True)
+    else:
+        if not data:
+            print("INT8 量化需要校准数据集，请通过 --data 指定数据集 yaml (例如训练时使用的 my.yaml)。")
+            return None
+        # 训练后量化 (NNCF)，校准集应覆盖各种机台截图，量化后请用 compare_detector_backends.py 复核
+        exported = model.export(format='openvino', imgsz=imgsz, dynamic=True, int8=True, data=data)
+
+    target = recognizer.DETECTOR_MODEL_PATHS[backend]
+    exported = str(exported).rstrip('/\\')
+    if os.path.abspath(exported) != os.path.abspath(target):
+        if os.path.isdir(target):
+            shutil.rmtree(target)
+        elif os.path.exists(target):
+            os.remove(target)
+        shutil.move(exported, target)
+    print(f"[{backend}] 导出完成: {target}")
+    return target
+
+
+def main():
+    parser = argparse.ArgumentParser(description="导出标题检测模型的 ONNX / OpenVINO 版本")
+    parser.add_argument('--formats', nargs='+', default=['onnx', 'openvino'], choices=EXPORT_FORMATS,
+                        help="要导出的格式 (默认: onnx openvino)")
+    parser.add_argument('--imgsz', type=int, default=recognizer.CASCADE_FULL_IMGSZ, help="导出时的参考输入尺寸")
+    parser.add_argument('--data', default=None, help="INT8 量化所用的校准数据集 yaml")
+    args = parser.parse_args()
+
+    if not os.path.exists(recognizer.YOLO_MODEL_PATH):
+        print(f"错误: 找不到原始模型 {recognizer.YOLO_MODEL_PATH}")
+        sys.exit(1)
+    for backend in args.formats:
+        export_backend(backend, args.imgsz, args.data)
+
+
+if __name__ == '__main__':
+    main()
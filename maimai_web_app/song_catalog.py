@@ -0,0 +1,190 @@
+import hashlib
+import json
+import os
+import threading
+import time
+
+import fast_json
+from alias_index import AliasIndex
+from ngram_index import NgramIndex
+from suggest_index import SuggestIndex
+from title_matcher import TitleMatcher
+
+
+class CatalogSnapshot:
+    """
+    某一时刻的歌曲库与别名库，以及在加载时预先建立的索引。
+    快照创建后不再修改，请求线程可以不加锁地读取；更新时整体替换为新的快照。
+    """
+
+    def __init__(self, songs, aliases_data, etag, signature):
+        self.songs = songs
+        self.aliases = aliases_data.get('content', []) if isinstance(aliases_data, dict) else []
+        self.alias_index = AliasIndex(self.aliases)
+        self.etag = etag
+        self.signature = signature
+        self.loaded_at = time.time()
+
+        # 封面地址在加载时一次性写入，之后所有接口直接返回歌曲对象
+        for song in songs:
+            song['cover_url'] = f"/cover/{song['id']}"
+
+        # id -> 歌曲版本
+        self.by_id = {str(song['id']): song for song in songs}
+        # 标题 -> 该标题的所有版本 (SD/DX)
+        self.by_title = {}
+        for song in songs:
+            self.by_title.setdefault(song['title'], []).append(song)
+        self.titles = list(self.by_title)
+        self.title_matcher = TitleMatcher(self.titles)
+        # 标题与 (歌曲库中存在的) 别名共同组成文本搜索的 n-gram 索引，标题排在前面
+        documents = [(title, title) for title in self.titles]
+        for entry in self.aliases:
+            if entry.get('Name') in self.by_title:
+                documents.extend((alias, entry['Name']) for alias in entry.get('Alias', []) or [])
+        self.search_index = NgramIndex(documents)
+        self.suggest_index = SuggestIndex(self.by_title, self.aliases)
+
+        # **预序列化改造**: 每个标题的全部版本、每个单独版本的响应体在加载时就编码好，
+        # 命中后直接返回字节；ETag 由歌曲库内容的哈希与标题/ID 派生，内容不变时保持不变。
+        self.version_tag = self._version_tag(self.songs, self.aliases)
+        self.title_json = {title: fast_json.dumps(versions) for title, versions in self.by_title.items()}
+        self.id_json = {song_id: fast_json.dumps([song]) for song_id, song in self.by_id.items()}
+        # (id, type, level_index) -> 谱面信息
+        self.charts = {}
+        for song in songs:
+            for level_index, chart in enumerate(song.get('charts', [])):
+                self.charts[(str(song['id']), song.get('type'), level_index)] = chart
+
+    @staticmethod
+    def _version_tag(songs, aliases):
+        """
+        歌曲与别名内容的哈希。不使用 songs.etag: 上游响应没有 ETag 时更新器照样会重写 songs.json，
+        ETag 文件不变而内容已变；别名变化同样会改变搜索与联想的结果。
+        """
+        digest = hashlib.sha1(fast_json.dumps(songs))
+        digest.update(fast_json.dumps(aliases))
+        return digest.hexdigest()[:16]
+
+    def serialized(self, versions):
+        """
+        返回 (JSON字节, ETag)；versions 须为 versions_of() 或按ID查到的单个版本列表，
+        其他结果返回 (None, None)，由调用方自行序列化。
+        """
+        if not versions:
+            return None, None
+        first = versions[0]
+        title_versions = self.by_title.get(first.get('title'), [])
+        if len(versions) == len(title_versions) and all(a is b for a, b in zip(versions, title_versions)):
+            key, body = f"t:{first['title']}", self.title_json[first['title']]
+        elif len(versions) == 1 and self.by_id.get(str(first['id'])) is first:
+            key, body = f"i:{first['id']}", self.id_json[str(first['id'])]
+        else:
+            return None, None
+        digest = hashlib.sha1(key.encode('utf-8')).hexdigest()[:12]
+        return body, f"{self.version_tag}-{digest}"
+
+    def versions_of(self, title):
+        return self.by_title.get(title, [])
+
+    def get_chart(self, song_id, song_type, level_index):
+        return self.charts.get((str(song_id), song_type, level_index))
+
+
+class SongCatalog:
+    """
+    **歌曲库常驻内存改造**: songs.json / aliases.json 只在启动时解析一次。
+    每隔 check_interval 秒检查一次文件的 mtime、大小与 songs.etag，
+    发现变化 (例如后台管理面板更新了歌曲数据) 时由当前请求重新加载，并原子地替换快照。
+    新文件解析失败时继续使用旧快照，下次检查时再重试。
+    """
+
+    def __init__(self, songs_path, aliases_path, etag_path, check_interval=2.0):
+        self.songs_path = songs_path
+        self.aliases_path = aliases_path
+        self.etag_path = etag_path
+        self.check_interval = check_interval
+        self._reload_lock = threading.Lock()
+        self._next_check = 0.0
+        self._snapshot = None
+        self._stats = {"reloads": 0, "failed_reloads": 0, "last_error": None}
+        self.reload()
+
+    def _signature(self):
+        signature = []
+        for path in (self.songs_path, self.aliases_path, self.etag_path):
+            try:
+                st = os.stat(path)
+                signature.append((st.st_mtime_ns, st.st_size))
+            except OSError:
+                signature.append(None)
+        return tuple(signature)
+
+    def _read_etag(self):
+        try:
+            with open(self.etag_path, 'r', encoding='utf-8') as f:
+                return f.read().strip() or None
+        except OSError:
+            return None
+
+    def _load(self, signature):
+        with open(self.songs_path, 'r', encoding='utf-8') as f:
+            songs = json.load(f)
+        aliases_data = {}
+        try:
+            with open(self.aliases_path, 'r', encoding='utf-8') as f:
+                aliases_data = json.load(f)
+        except Exception as e:
+            # 别名数据缺失不影响歌曲库本身
+            print(f"警告: 加载别名数据失败: {e}")
+        return CatalogSnapshot(songs, aliases_data, self._read_etag(), signature)
+
+    def reload(self):
+        """立即重新加载；失败时保留旧快照并返回 False"""
+        with self._reload_lock:
+            return self._reload_locked()
+
+    def _reload_locked(self):
+        signature = self._signature()
+        try:
+            snapshot = self._load(signature)
+        except Exception as e:
+            self._stats["failed_reloads"] += 1
+            self._stats["last_error"] = str(e)
+            print(f"警告: 加载歌曲库失败，继续使用旧数据: {e}")
+            if self._snapshot is None:
+                raise
+            return False
+        self._snapshot = snapshot
+        self._stats["reloads"] += 1
+        self._stats["last_error"] = None
+        print(f"歌曲库加载成功！共 {len(snapshot.songs)} 个谱面版本，{len(snapshot.aliases)} 条别名记录。")
+        return True
+
+    def get(self):
+        """返回当前快照；到了检查时间且文件有变化时先重新加载"""
+        now = time.monotonic()
+        if now >= self._next_check:
+            self._next_check = now + self.check_interval
+            # 已有其他线程在重新加载时不等待，直接返回旧快照
+            if self._signature() != self._snapshot.signature and self._reload_lock.acquire(blocking=False):
+                try:
+                    self._reload_locked()
+                finally:
+                    self._reload_lock.release()
+        return self._snapshot
+
+    def get_stats(self):
+        snapshot = self._snapshot
+        stats = dict(self._stats)
+        stats.update({
+            "songs": len(snapshot.songs),
+            "titles": len(snapshot.titles),
+            "aliases": len(snapshot.aliases),
+            **snapshot.alias_index.get_stats(),
+            **snapshot.search_index.get_stats(),
+            **snapshot.suggest_index.get_stats(),
+            "etag": snapshot.etag,
+            "loaded_at": snapshot.loaded_at,
+        })
+        return stats
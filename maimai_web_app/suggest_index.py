@@ -0,0 +1,115 @@
+import heapq
+from bisect import bisect_left
+
+from title_matcher import normalize_key
+
+# --- **输入联想改造**: 基于有序数组 + 二分查找的前缀索引 ---
+# 规范化后的标题、别名与歌曲ID各自排序存放，一次前缀查询只需两次二分，再对区间内的命中排序取前几条，
+# 适合在用户每次按键时调用。1~2 个字符的前缀区间几乎覆盖整个索引，它们的排序结果在建索引时就算好。
+
+SUGGEST_DEFAULT_LIMIT = 8
+SUGGEST_MAX_LIMIT = 20
+
+# 结果排序: 歌曲ID优先于官方标题，官方标题优先于别名
+_KIND_ID = 0
+_KIND_TITLE = 1
+_KIND_ALIAS = 2
+
+# 不超过该长度的前缀在建索引时预先排好前 SUGGEST_MAX_LIMIT 条
+_PRECOMPUTED_PREFIX_LEN = 2
+
+
+def _prefix_range(keys, prefix):
+    """返回有序列表 keys 中以 prefix 开头的下标区间 [lo, hi)"""
+    lo = bisect_left(keys, prefix)
+    hi = bisect_left(keys, prefix + '\U0010ffff', lo)
+    return lo, hi
+
+
+class SuggestIndex:
+    def __init__(self, by_title, alias_entries):
+        """by_title: 标题 -> 版本列表；alias_entries: aliases.json 的 content 列表"""
+        rows = []
+        for title in by_title:
+            rows.append((normalize_key(title), _KIND_TITLE, title, title))
+        for entry in alias_entries:
+            title = entry.get('Name')
+            if title not in by_title:
+                continue
+            for alias in entry.get('Alias', []) or []:
+                rows.append((normalize_key(alias), _KIND_ALIAS, title, alias))
+        rows = sorted(row for row in rows if row[0])
+        self.keys = [row[0] for row in rows]
+        self.rows = [(row[2], row[3], row[1]) for row in rows]
+
+        # 每个版本的ID都可以联想 (SD与DX的ID不同)
+        id_rows = sorted((str(version['id']), title, index) for title, versions in by_title.items()
+                         for index, version in enumerate(versions))
+        self.id_keys = [row[0] for row in id_rows]
+        self.id_rows = [(row[1], row[2]) for row in id_rows]
+        self.by_title = by_title
+
+        # 短前缀 -> 排好序的前 SUGGEST_MAX_LIMIT 条 (标题, 命中的文本, 版本下标)
+        # 全数字的前缀与同样的数字查询对应，连同歌曲ID一起排序
+        short_prefixes = {key[:length] for key in self.keys + self.id_keys
+                          for length in range(1, _PRECOMPUTED_PREFIX_LEN + 1)}
+        self.precomputed = {
+            prefix: self._rank(prefix if prefix.isdigit() else None, prefix, SUGGEST_MAX_LIMIT)
+            for prefix in short_prefixes
+        }
+
+    def _item(self, title, matched, version_index=0):
+        """紧凑的联想条目: ID、标题、封面，以及 (命中的是别名或ID时) 命中的文本"""
+        song = self.by_title[title][version_index]
+        item = {"id": song['id'], "title": title, "cover_url": song['cover_url']}
+        if matched != title:
+            item["match"] = matched
+        return item
+
+    def _rank(self, id_query, prefix, limit):
+        """
+        扫描前缀区间，返回排序后的前 limit 条 (标题, 命中的文本, 版本下标)，同一首歌只出现一次。
+        与查询完全相同的优先，其次ID、官方标题、别名，再其次键较短的。id_query 为 None 时不查歌曲ID。
+        """
+        # 标题 -> (排序键, 命中的文本, 版本下标)，同一首歌只保留排序最靠前的命中
+        best = {}
+
+        def consider(key, kind, title, matched, version_index=0):
+            rank = (key != prefix, kind, len(key), key)
+            current = best.get(title)
+            if current is None or rank < current[0]:
+                best[title] = (rank, matched, version_index)
+
+        if id_query is not None:
+            lo, hi = _prefix_range(self.id_keys, id_query)
+            for i in range(lo, hi):
+                title, version_index = self.id_rows[i]
+                consider(self.id_keys[i], _KIND_ID, title, self.id_keys[i], version_index)
+
+        lo, hi = _prefix_range(self.keys, prefix)
+        for i in range(lo, hi):
+            title, matched, kind = self.rows[i]
+            consider(self.keys[i], kind, title, matched)
+
+        ranked = heapq.nsmallest(limit, best.items(), key=lambda item: item[1][0])
+        return [(title, matched, version_index) for title, (_, matched, version_index) in ranked]
+
+    def suggest(self, query, limit=SUGGEST_DEFAULT_LIMIT):
+        """返回以 query 为前缀的前 limit 条联想结果 (同一首歌只出现一次)"""
+        query = (query or '').strip()
+        if not query:
+            return []
+        id_query = query if query.isdigit() else None
+        prefix = normalize_key(query)
+        # 短前缀直接取预先排好的结果；全角数字等规范化后与原查询不同的，仍按区间扫描
+        ranked = None
+        if len(prefix) <= _PRECOMPUTED_PREFIX_LEN and limit <= SUGGEST_MAX_LIMIT \
+                and id_query == (prefix if prefix.isdigit() else None):
+            ranked = self.precomputed.get(prefix, [])
+        if ranked is None:
+            ranked = self._rank(id_query, prefix, limit)
+        return [self._item(title, matched, version_index) for title, matched, version_index in ranked[:limit]]
+
+    def get_stats(self):
+        return {"suggest_keys": len(self.keys), "suggest_ids": len(self.id_keys),
+                "suggest_precomputed_prefixes": len(self.precomputed)}
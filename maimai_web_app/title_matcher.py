@@ -0,0 +1,66 @@
+import unicodedata
+
+import numpy as np
+from rapidfuzz import fuzz, process
+
+# --- **向量化匹配改造**: 歌曲标题模糊匹配引擎 ---
+# 标题在加载时统一规范化一次 (全角/半角、大小写、标点、空白)，
+# 查询时通过 rapidfuzz 的 cdist 在C层一次性计算与所有标题的相似度。
+
+# 规范化时视为分隔符的Unicode类别: 标点 (P*)、空白 (Z*)、数学符号与修饰符号 (Sm/Sk，如 ~ + ^)。
+# ♥ ☆ 等其他符号 (So) 保留，它们在部分标题中是唯一的区分信息。
+_SEPARATOR_CATEGORIES = ('P', 'Z', 'Sm', 'Sk')
+
+
+def normalize_text(text, symbols_fallback=True):
+    """
+    NFKC (全角转半角) + casefold，标点与空白替换为单个空格 (与 fuzzywuzzy 的默认预处理一致)。
+    保留词边界: WRatio 的 token_sort/token_set 打分按空格切词，词序不同的写法才能得到高分。
+    结果为空时 (例如别名只有 ↑↓ 等符号)，默认退回只做NFKC与casefold的文本；
+    模糊匹配的查询应传 symbols_fallback=False，只有符号的查询不参与匹配。
+    """
+    folded = unicodedata.normalize('NFKC', text or '').casefold()
+    spaced = ''.join(' ' if unicodedata.category(ch).startswith(_SEPARATOR_CATEGORIES) else ch for ch in folded)
+    normalized = ' '.join(spaced.split())
+    if normalized or not symbols_fallback:
+        return normalized
+    return folded.strip() or folded
+
+
+def normalize_key(text):
+    """精确查找与前缀联想用的键: 在 normalize_text 的基础上去掉空格，输入时是否带空格不影响命中"""
+    key = normalize_text(text)
+    return key.replace(' ', '') or key
+
+
+class TitleMatcher:
+    """对一组标题做批量模糊匹配，打分使用 WRatio (与原 fuzzywuzzy process.extract 的默认打分一致)"""
+
+    def __init__(self, titles):
+        self.titles = list(titles)
+        self.normalized = [normalize_text(title) for title in self.titles]
+
+    def top_k_batch(self, queries, k=2, score_cutoff=0):
+        """
+        一次调用计算多个查询的前k个匹配，返回与 queries 等长的列表，
+        每项为按分数降序排列的 [(标题, 分数), ...]。
+        """
+        results = [[] for _ in queries]
+        # 规范化后为空的查询 (只有标点或空白) 不参与匹配
+        normalized_queries = [normalize_text(query, symbols_fallback=False) for query in queries]
+        valid = [i for i, query in enumerate(normalized_queries) if query]
+        if not valid or not self.titles:
+            return results
+        scores = process.cdist([normalized_queries[i] for i in valid], self.normalized, scorer=fuzz.WRatio,
+                               score_cutoff=score_cutoff, workers=1)
+        top = min(k, len(self.titles))
+        for query_index, row in zip(valid, scores):
+            candidates = np.argpartition(-row, top - 1)[:top]
+            # 分数降序，同分时按标题下标排序，保证结果可复现
+            order = candidates[np.lexsort((candidates, -row[candidates]))]
+            results[query_index] = [(self.titles[i], round(float(row[i]), 2)) for i in order if row[i] > 0]
+        return results
+
+    def top_k(self, query, k=2, score_cutoff=0):
+        """返回单个查询的前k个匹配 [(标题, 分数), ...]"""
+        return self.top_k_batch([query], k=k, score_cutoff=score_cutoff)[0]
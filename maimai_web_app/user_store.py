@@ -0,0 +1,193 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+# --- **用户存储改造**: 基于 SQLite 的会话与成绩存储 ---
+# 会话 (session_token -> 用户名、JWT) 原本只存在内存字典和体积很大的用户JSON文件里，
+# 启动恢复与JWT解析失败时的后备查找都要逐个解析 user_data/ 下的全部文件。
+# 现在单独存放在一个 SQLite 文件中，以 session_token 为主键，查询只走索引，不随用户数增长。
+# 个人资料与成绩记录同样存入该数据库: 成绩按 (用户名, 歌曲ID, 谱面类型, 难度) 建立索引，
+# 查询单首歌的成绩不再需要加载并遍历用户的全部记录。
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    session_token TEXT PRIMARY KEY,
+    username      TEXT NOT NULL,
+    jwt_token     TEXT NOT NULL,
+    created_at    REAL NOT NULL,
+    updated_at    REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_sessions_username ON sessions (username);
+CREATE TABLE IF NOT EXISTS profiles (
+    username          TEXT PRIMARY KEY,
+    rating            INTEGER,
+    additional_rating INTEGER,
+    bind_qq           TEXT,
+    plate             TEXT,
+    updated_at        REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS scores (
+    username     TEXT NOT NULL,
+    song_id      TEXT NOT NULL,
+    type         TEXT NOT NULL,
+    level_index  INTEGER NOT NULL,
+    achievements REAL,
+    dx_score     INTEGER,
+    fc           TEXT,
+    fs           TEXT,
+    rate         TEXT,
+    level        TEXT,
+    ds           REAL,
+    ra           INTEGER
+);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_scores_chart ON scores (username, song_id, type, level_index);
+CREATE TABLE IF NOT EXISTS meta (
+    key   TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+
+class UserStore:
+    """
+    用户数据的 SQLite 存储。每个线程使用自己的连接 (waitress 线程池)，
+    数据库开启 WAL 模式，读操作不会被写操作阻塞。
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        db_dir = os.path.dirname(db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        self._local = threading.local()
+        self._stats_lock = threading.Lock()
+        self._stats = {"session_hits": 0, "session_misses": 0}
+        with self._connection() as conn:
+            conn.executescript(SCHEMA)
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=10)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _count(self, key):
+        with self._stats_lock:
+            self._stats[key] += 1
+
+    # --- 会话 ---
+    def get_session(self, session_token):
+        """返回 {"username", "jwt_token"}，会话不存在时返回 None"""
+        row = self._connection().execute(
+            "SELECT username, jwt_token FROM sessions WHERE session_token = ?", (session_token,)
+        ).fetchone()
+        self._count("session_hits" if row else "session_misses")
+        return dict(row) if row else None
+
+    def save_session(self, session_token, username, jwt_token):
+        now = time.time()
+        with self._connection() as conn:
+            conn.execute(
+                "INSERT INTO sessions (session_token, username, jwt_token, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT(session_token) DO UPDATE SET "
+                "username = excluded.username, jwt_token = excluded.jwt_token, updated_at = excluded.updated_at",
+                (session_token, username, jwt_token, now, now),
+            )
+
+    def delete_session(self, session_token):
+        with self._connection() as conn:
+            conn.execute("DELETE FROM sessions WHERE session_token = ?", (session_token,))
+
+    # --- 个人资料与成绩 ---
+    def save_user_data(self, username, user_data):
+        """用 Diving-Fish 返回的完整数据覆盖该用户的资料与全部成绩 (单个事务)"""
+        now = time.time()
+        score_rows = [
+            (username, str(record.get("song_id")), record.get("type") or "", record.get("level_index"),
+             record.get("achievements"), record.get("dxScore"), record.get("fc"), record.get("fs"),
+             record.get("rate"), record.get("level"), record.get("ds"), record.get("ra"))
+            for record in user_data.get("records", []) or []
+            if record.get("song_id") is not None and record.get("level_index") is not None
+        ]
+        with self._connection() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO profiles (username, rating, additional_rating, bind_qq, plate, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (username, user_data.get("rating"), user_data.get("additional_rating"),
+                 user_data.get("bind_qq"), user_data.get("plate"), now),
+            )
+            conn.execute("DELETE FROM scores WHERE username = ?", (username,))
+            conn.executemany(
+                "INSERT OR REPLACE INTO scores (username, song_id, type, level_index, achievements, dx_score, "
+                "fc, fs, rate, level, ds, ra) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                score_rows,
+            )
+        return len(score_rows)
+
+    def get_profile(self, username):
+        """返回个人资料字典，该用户没有数据时返回 None"""
+        row = self._connection().execute(
+            "SELECT username, rating, additional_rating, bind_qq, plate FROM profiles WHERE username = ?",
+            (username,),
+        ).fetchone()
+        return dict(row) if row else None
+
+    @staticmethod
+    def _score_from_row(row):
+        return {
+            "achievements": row["achievements"], "dxScore": row["dx_score"], "fc": row["fc"], "fs": row["fs"],
+            "rate": row["rate"], "level": row["level"], "level_index": row["level_index"], "type": row["type"],
+        }
+
+    def get_scores(self, username, song_id):
+        """返回该用户在某首歌所有谱面上的成绩 (字段名与 Diving-Fish 的 records 一致)"""
+        rows = self._connection().execute(
+            "SELECT achievements, dx_score, fc, fs, rate, level, level_index, type FROM scores "
+            "WHERE username = ? AND song_id = ? ORDER BY type, level_index",
+            (username, str(song_id)),
+        ).fetchall()
+        return [self._score_from_row(row) for row in rows]
+
+    def import_sessions_from_files(self, user_data_dir):
+        """
+        一次性迁移: 从旧版用户JSON文件中导入会话。完成后记录在 meta 表中，之后启动不再扫描目录。
+        返回导入的会话数 (已迁移过时返回 None)。
+        """
+        conn = self._connection()
+        if conn.execute("SELECT 1 FROM meta WHERE key = 'sessions_imported'").fetchone():
+            return None
+        imported = 0
+        filenames = [f for f in os.listdir(user_data_dir) if f.endswith('.json')] if os.path.isdir(user_data_dir) else []
+        for filename in filenames:
+            try:
+                with open(os.path.join(user_data_dir, filename), 'r', encoding='utf-8') as f:
+                    user_data = json.load(f)
+            except Exception as e:
+                print(f"迁移会话时无法读取 {filename}: {e}")
+                continue
+            username = user_data.get("username")
+            session_token = user_data.get("session_token")
+            jwt_token = user_data.get("jwt_token")
+            if not username or not session_token or not jwt_token:
+                continue
+            self.save_session(session_token, username, jwt_token)
+            imported += 1
+        with conn:
+            conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('sessions_imported', ?)",
+                         (str(time.time()),))
+        return imported
+
+    def get_stats(self):
+        with self._stats_lock:
+            stats = dict(self._stats)
+        conn = self._connection()
+        stats["sessions"] = conn.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+        stats["profiles"] = conn.execute("SELECT COUNT(*) FROM profiles").fetchone()[0]
+        return stats